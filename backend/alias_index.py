@@ -0,0 +1,344 @@
+"""Local alias index mapping document terms and column headers to canonical variables.
+
+The index is built from GENERIC_INSURANCE_TERMS (an entry such as
+ISSUE_AGE: ENTRY_AGE suggests ISSUE_AGE is an alias), the custom input
+variables and mappings users have confirmed, which are persisted as JSON.
+A generic entry may relate two different quantities (FULL_TERM_PREMIUM:
+PREMIUM), so until a user confirms it, a match through it is reported as
+'generic' and, like a fuzzy match, is never applied silently. A term is
+resolved by its normalized key, then its alias chain, then its set of words
+and finally a trigram index, so names are mapped in microseconds without a
+model call.
+"""
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Iterable, Optional, Set, Tuple
+
+from insurance_terms import GENERIC_INSURANCE_TERMS
+
+# Trigram similarity a fuzzy match needs to be trusted
+FUZZY_THRESHOLD = 0.7
+# ... and by how much it must beat the best match in another alias group
+FUZZY_MARGIN = 0.1
+# Words ignored when comparing word sets ("Age at Entry" matches ENTRY_AGE)
+STOPWORDS = frozenset({'a', 'an', 'and', 'at', 'by', 'for', 'in', 'of', 'on', 'per', 'the', 'to'})
+# Abbreviations and spellings normalized to one token
+TOKEN_SYNONYMS = {
+    'amt': 'amount', 'no': 'number', 'num': 'number', 'nbr': 'number', 'dt': 'date',
+    'yr': 'year', 'yrs': 'year', 'years': 'year', 'prem': 'premium', 'premiums': 'premium',
+    'freq': 'frequency', 'pct': 'percent', 'annualized': 'annualised'
+}
+
+_CAMEL = re.compile(r'(?<=[a-z0-9])(?=[A-Z])')
+_WORDS = re.compile(r'[a-z0-9]+')
+# Quoted strings are skipped; identifiers followed by "(" are function names
+_IDENTIFIER = re.compile(r'(\'[^\']*\'|"[^"]*")|\b([A-Za-z_][A-Za-z0-9_]*)\b(?!\s*\()')
+
+def tokens(name: str) -> Tuple[str, ...]:
+    text = _CAMEL.sub(' ', str(name)).lower().replace('%', ' percent ')
+    return tuple(TOKEN_SYNONYMS.get(word, word) for word in _WORDS.findall(text))
+
+def normalize_key(name: str) -> str:
+    """ISSUE_AGE, Issue Age, issueAge and issue-age all give 'issue_age'"""
+    return '_'.join(tokens(name))
+
+def _word_set(key: str) -> str:
+    return ' '.join(sorted({word for word in key.split('_') if word not in STOPWORDS}))
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key.replace('_', ' ')} "
+    return {padded[pos:pos + 3] for pos in range(len(padded) - 2)}
+
+@dataclass
+class AliasMatch:
+    term: str
+    target: str
+    method: str  # 'exact', 'alias', 'words', 'generic' or 'fuzzy'
+    score: float = 1.0
+    chain: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+class AliasIndex:
+    """Normalized names, alias chains and a trigram index over known variables"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.RLock()
+        # normalized key -> name as first registered
+        self._names: Dict[str, str] = {}
+        # alias key -> key it stands for
+        self._parent: Dict[str, str] = {}
+        # alias keys whose link comes from a generic term and was not confirmed
+        self._suggested: Set[str] = set()
+        # keys returned instead of their group's root (custom variables)
+        self._preferred: Set[str] = set()
+        self._word_sets: Dict[str, Set[str]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._key_trigrams: Dict[str, Set[str]] = {}
+        # confirmed alias -> canonical, as persisted
+        self._confirmed: Dict[str, str] = {}
+        self._loaded_mtime: Optional[float] = None
+
+    def add_term(self, name: str, preferred: bool = False) -> Optional[str]:
+        key = normalize_key(name)
+        if not key:
+            return None
+        with self._lock:
+            if key not in self._names:
+                self._names[key] = str(name).strip()
+                self._word_sets.setdefault(_word_set(key), set()).add(key)
+                grams = _trigrams(key)
+                self._key_trigrams[key] = grams
+                for gram in grams:
+                    self._trigrams.setdefault(gram, set()).add(key)
+            if preferred:
+                # Custom variables keep the spelling the user gave
+                self._names[key] = str(name).strip()
+                self._preferred.add(key)
+        return key
+
+    def add_alias(self, alias: str, target: str, suggested: bool = False) -> bool:
+        """Make `alias` stand for `target`; refused if it would close a cycle.
+
+        A suggested alias only links the names; matches through it are
+        reported as 'generic' until the alias is added again unsuggested.
+        """
+        with self._lock:
+            alias_key, target_key = self.add_term(alias), self.add_term(target)
+            if not alias_key or not target_key or self._root(target_key)[0] == alias_key:
+                return False
+            self._parent[alias_key] = target_key
+            if suggested:
+                self._suggested.add(alias_key)
+            else:
+                self._suggested.discard(alias_key)
+            return True
+
+    def _root(self, key: str) -> Tuple[str, List[str]]:
+        chain = [key]
+        while key in self._parent and self._parent[key] not in chain:
+            key = self._parent[key]
+            chain.append(key)
+        return key, chain
+
+    def _representative(self, key: str) -> Tuple[str, List[str]]:
+        """The name a key resolves to: a preferred member of its group, else the group's root"""
+        root, chain = self._root(key)
+        for member in chain:
+            if member in self._preferred:
+                return member, chain[:chain.index(member) + 1]
+        if root not in self._preferred:
+            for other in sorted(self._preferred):
+                if self._root(other)[0] == root:
+                    return other, chain + [other]
+        return root, chain
+
+    def _through_suggested(self, key: str, target: str) -> bool:
+        """Whether getting from key to target follows an unconfirmed generic alias"""
+        chain = self._root(key)[1]
+        if target in chain:
+            path = chain[:chain.index(target)]
+        else:
+            path = chain[:-1] + self._root(target)[1][:-1]
+        return any(member in self._suggested for member in path)
+
+    def _fuzzy(self, key: str) -> Optional[Tuple[str, float]]:
+        grams = _trigrams(key)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self._trigrams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        # Codes such as GSV/SSV or SSV2/SSV3 differ by one character, so they must match exactly
+        codes = {word for word in key.split('_') if len(word) <= 3 or any(ch.isdigit() for ch in word)} - STOPWORDS
+        scored = sorted(
+            ((2.0 * count / (len(grams) + len(self._key_trigrams[candidate])), candidate)
+             for candidate, count in shared.items() if codes <= set(candidate.split('_'))),
+            reverse=True
+        )
+        if not scored or scored[0][0] < FUZZY_THRESHOLD:
+            return None
+        best_score, best = scored[0]
+        best_root = self._root(best)[0]
+        for score, candidate in scored[1:]:
+            if self._root(candidate)[0] != best_root:
+                if best_score - score < FUZZY_MARGIN:
+                    return None
+                break
+        return best, best_score
+
+    def resolve(self, term: str, fuzzy: bool = True) -> Optional[AliasMatch]:
+        """Canonical variable for a term, or None when nothing matches unambiguously"""
+        key = normalize_key(term)
+        if not key:
+            return None
+        with self._lock:
+            method, score = 'exact', 1.0
+            if key not in self._names:
+                candidates = self._word_sets.get(_word_set(key), set())
+                roots = {self._root(candidate)[0] for candidate in candidates}
+                if len(roots) == 1:
+                    key, method = min(candidates), 'words'
+                elif fuzzy and not candidates:
+                    found = self._fuzzy(key)
+                    if found is None:
+                        return None
+                    (key, score), method = found, 'fuzzy'
+                else:
+                    return None
+            target, chain = self._representative(key)
+            if method != 'fuzzy' and self._through_suggested(key, target):
+                method = 'generic'
+            elif method == 'exact' and target != key:
+                method = 'alias'
+            return AliasMatch(str(term), self._names[target], method, round(score, 3),
+                              [self._names[member] for member in chain])
+
+    def with_terms(self, names: Iterable[str]) -> 'AliasIndex':
+        """A copy that also knows `names`, preferred over the generic names of their group"""
+        extended = AliasIndex()
+        with self._lock:
+            extended._names = dict(self._names)
+            extended._parent = dict(self._parent)
+            extended._suggested = set(self._suggested)
+            extended._preferred = set(self._preferred)
+            extended._word_sets = {words: set(keys) for words, keys in self._word_sets.items()}
+            extended._trigrams = {gram: set(keys) for gram, keys in self._trigrams.items()}
+            extended._key_trigrams = dict(self._key_trigrams)
+            extended._confirmed = dict(self._confirmed)
+        for name in names:
+            extended.add_term(name, preferred=True)
+        return extended
+
+    def confirm(self, alias: str, canonical: str) -> bool:
+        """Record a mapping confirmed by a user and persist it"""
+        with self._lock:
+            if not self.add_alias(alias, canonical):
+                return False
+            self._confirmed[str(alias).strip()] = str(canonical).strip()
+            self._save()
+            return True
+
+    def confirmed(self) -> Dict[str, str]:
+        return dict(self._confirmed)
+
+    def _save(self):
+        if not self.path:
+            return
+        temp = f"{self.path}.tmp"
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump({"aliases": self._confirmed}, f, indent=2, sort_keys=True)
+        os.replace(temp, self.path)
+        self._loaded_mtime = os.path.getmtime(self.path)
+
+    def load(self):
+        """Load confirmed mappings from the JSON file, if there is one"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        with self._lock:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    aliases = json.load(f).get('aliases', {})
+                self._loaded_mtime = os.path.getmtime(self.path)
+            except (OSError, ValueError) as e:
+                print(f"Could not load confirmed aliases from {self.path}: {e}")
+                return
+            for alias, canonical in aliases.items():
+                if self.add_alias(alias, canonical):
+                    self._confirmed[alias] = canonical
+        print(f"Loaded {len(self._confirmed)} confirmed aliases")
+
+    def refresh(self):
+        """Pick up mappings confirmed by the other service since the last load"""
+        if self.path and os.path.exists(self.path) and os.path.getmtime(self.path) != self._loaded_mtime:
+            self.load()
+
+    def __contains__(self, name: str) -> bool:
+        return normalize_key(name) in self._names
+
+    def __len__(self):
+        return len(self._names)
+
+    def describe(self) -> Dict:
+        return {"names": len(self._names), "aliases": len(self._parent), "unconfirmed": len(self._suggested),
+                "confirmed": len(self._confirmed)}
+
+def build_index(terms: Dict[str, str], path: Optional[str] = None) -> AliasIndex:
+    """Index the generic terms; an entry whose description names another term suggests an alias"""
+    index = AliasIndex(path)
+    for name, description in terms.items():
+        target = str(description).strip()
+        if target in terms and target != name:
+            index.add_alias(name, target, suggested=True)
+        else:
+            index.add_term(name)
+    index.load()
+    return index
+
+def canonicalize_expression(expr: str, index: AliasIndex) -> Tuple[str, Dict[str, str]]:
+    """Rename variables of an expression to their canonical names.
+
+    Only exact, alias and word-set matches are applied; fuzzy matches and
+    unconfirmed generic aliases are left for a user to confirm, so a name
+    only gets its registered spelling. Returns the expression and the renames.
+    """
+    renamed: Dict[str, str] = {}
+
+    def replace(match):
+        if match.group(1):
+            return match.group(0)
+        name = match.group(2)
+        found = index.resolve(name, fuzzy=False)
+        if found is None:
+            return name
+        target = found.chain[0] if found.method == 'generic' else found.target
+        if target == name:
+            return name
+        renamed[name] = target
+        return target
+
+    return _IDENTIFIER.sub(replace, expr), renamed
+
+def match_columns(names: Iterable[str], columns: Iterable[str], index: AliasIndex) -> Dict[str, AliasMatch]:
+    """Upload column holding each variable that no column is named after.
+
+    A column matches when it normalizes to the variable's name or word set,
+    when both resolve to the same canonical variable (ISSUE_AGE and Entry
+    Age), or, failing both, when it is the one close fuzzy match. A match
+    through an unconfirmed generic alias has method 'generic'.
+    """
+    columns = [str(col) for col in columns]
+    column_index = AliasIndex()
+    for col in columns:
+        column_index.add_term(col)
+    column_targets: Dict[str, AliasMatch] = {}
+    for col in columns:
+        found = index.resolve(col, fuzzy=False)
+        if found is not None:
+            column_targets.setdefault(found.target, found)
+
+    matches: Dict[str, AliasMatch] = {}
+    for name in names:
+        direct = column_index.resolve(name, fuzzy=False)
+        if direct is not None:
+            matches[name] = direct
+            continue
+        found = index.resolve(name, fuzzy=False)
+        if found is not None and found.target in column_targets:
+            column = column_targets[found.target]
+            method = 'generic' if 'generic' in (found.method, column.method) else 'alias'
+            chain = found.chain + column.chain[-2::-1] + [column.term]
+            matches[name] = AliasMatch(name, column.term, method, 1.0, chain)
+            continue
+        fuzzy = column_index.resolve(name)
+        if fuzzy is not None:
+            matches[name] = fuzzy
+    return matches
+
+ALIAS_FILE = os.getenv('ALIAS_FILE', 'confirmed_aliases.json')
+
+ALIAS_INDEX = build_index(GENERIC_INSURANCE_TERMS, ALIAS_FILE)
@@ -1,19 +1,29 @@
 import os
 import re
 import json
-from typing import List, Dict, Tuple, Optional, Set
-from flask import Flask, request, jsonify
+from typing import List, Dict, Tuple, Optional, Set, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from pdfminer.high_level import extract_text as extract_text_from_pdf_lib
 import google.generativeai as genai
-import requests
 from dotenv import load_dotenv
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 import hashlib
 import time
+import uuid
+from functools import lru_cache
 import traceback
 from werkzeug.utils import secure_filename
 
+from document_preprocessing import preprocess_document_text
+from document_tables import ExtractedTable, document_prefix, extract_docx, extract_pdf
+from factor_tables import FactorTable, FactorTableError
+from formula_handoff import HandoffError, ProcessorClient
+from insurance_terms import GENERIC_INSURANCE_TERMS
+from alias_index import ALIAS_INDEX, AliasIndex, canonicalize_expression
+from formula_engine import FormulaCompileError, compile_formula
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -30,6 +40,19 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 ALLOWED_EXTENSIONS = {'pdf', 'txt', 'docx'}
 
+# /upload-batch limits: documents per request and documents extracted at once
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '20'))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+
+# Formula processor service; in-process mode runs it in this process and shares its registries
+PROCESSOR_URL = os.getenv('PROCESSOR_URL', 'http://127.0.0.1:5001')
+IN_PROCESS_PROCESSOR = os.getenv('IN_PROCESS_PROCESSOR', 'false').lower() == 'true'
+processor_client = ProcessorClient(
+    PROCESSOR_URL,
+    in_process=IN_PROCESS_PROCESSOR,
+    timeout=(3.05, float(os.getenv('PROCESSOR_TIMEOUT_SECONDS', '30')))
+)
+
 # --- API KEY CONFIGURATION ---
 API_KEY = os.getenv('GEMINI_API_KEY')
 if not API_KEY:
@@ -40,69 +63,6 @@ else:
     genai.configure(api_key=API_KEY)
     MOCK_MODE = False
 
-# --- GENERIC INSURANCE TERMS DICTIONARY ---
-GENERIC_INSURANCE_TERMS = {
-    'TERM_START_DATE': 'Policy commencement date',
-    'DATE_OF_COMMENCEMENT': 'TERM_START_DATE',
-    'ENTRY_AGE': 'Age of the policyholder at policy inception',
-    'BENEFIT_TERM': 'Duration for which benefits are payable in months',
-    'ISSUE_AGE': 'ENTRY_AGE',
-    'PREMIUM': 'Premium amount (annual/monthly/quarterly)',
-    'FULL_TERM_PREMIUM': 'PREMIUM',
-    'ANNUALISED_PREMIUM': 'Annual premium amount',
-    'POLICY_YEAR':'ROUND(YEARFRAC(TERM_START_DATE, DATE_OF_SURRENDER)+1,0)',
-    'MONTHLY_PREMIUM': 'Monthly premium amount',
-    'PREMIUM_FREQUENCY': 'Frequency of premium payment',
-    'BOOKING_FREQUENCY': 'Frequency of premium booking',
-    'BOOKING_TIME': 'Duration for premium booking in years',
-    'POLICY_TERM': 'Total duration of the policy',
-    'PREMIUM_TERM': 'Premium Paying Term - duration for paying premiums',
-    'SA': 'Sum Assured - guaranteed amount on maturity/death',
-    'SUM_ASSURED': 'Basic sum assured amount',
-    'DEATH_BENEFIT': 'Benefit payable on death',
-    'MATURITY_BENEFIT': 'Benefit payable on maturity',
-    'INCOME_BENEFIT_AMOUNT': 'Amount of income benefit',
-    'INCOME_BENEFIT_FREQUENCY': 'Frequency of income benefit payout',
-    'SURRENDER_DATE': 'Date when policy is surrendered',
-    'MATURITY_DATE': 'EDATE(TERM_START_DATE,(BENEFIT_TERM*12))',
-    'FUP': 'First Unpaid Premium date',
-    'FIRST_UNPAID_PREMIUM_DATE': 'Date of first unpaid premium',
-    'NO_OF_PREMIUM_PAID': 'Number of premiums paid',
-    'PREMIUMS_PAID_COUNT': 'Count of premiums paid',
-    'POLICY_YEAR': 'Current policy year',
-    'TOTAL_PREMIUM_PAID': 'Total amount of premiums paid',
-    'GSV': 'Guaranteed Surrender Value',
-    'SSV': 'Special Surrender Value',
-    'SSV1_AMT': 'Special Surrender Value component 1',
-    'SSV2_AMT': 'Special Surrender Value component 2', 
-    'SSV3_AMT': 'Special Surrender Value component 3',
-    'PAID_UP_SA': 'Paid-up Sum Assured',
-    'PAID_UP_VALUE': 'Paid-up policy value',
-    'LOYALTY_ADDITION': 'Loyalty addition amount',
-    'BONUS': 'Bonus amount',
-    'CASH_VALUE': 'Cash value of the policy',
-    'SURRENDER_CHARGE': 'Charges applicable on surrender',
-    'MORTALITY_CHARGE': 'Mortality charges',
-    'ADMIN_CHARGE': 'Administration charges',
-    'FUND_VALUE': 'Current fund value',
-    'NAV': 'Net Asset Value',
-    'UNITS': 'Number of units allocated',
-    'UNIT_PRICE': 'Price per unit',
-    'TOP_UP_PREMIUM': 'Additional premium paid',
-    'PARTIAL_WITHDRAWAL': 'Amount withdrawn partially',
-    'LOAN_AMOUNT': 'Policy loan amount',
-    'INTEREST_RATE': 'Interest rate applicable',
-    'DISCOUNT_RATE': 'Discount rate for calculations',
-    'MORTALITY_RATE': 'Mortality rate factor',
-    'LAPSE_RATE': 'Policy lapse rate',
-    'GUARANTEED_RATE': 'Guaranteed interest rate',
-    'CURRENT_RATE': 'Current interest rate',
-    'PROJECTED_RATE': 'Projected interest rate'
-    'SV_FACTOR: Surrender Value Factoradditional factor (sometimes policy-specific) used to adjust GSV or non-guaranteed components.', 
-    'SSV2_FACTOR': 'Special Surrender Value Factor - additional factor used to adjust SSV component based on ROP or additional benefits.',
-    'SSV3_FACTOR': 'Special Surrender Value Factor - additional factor used to adjust SSV component based on paid-up income benefits or survival benefits.'
-}   
-
 @dataclass
 class ExtractedFormula:
     formula_name: str
@@ -115,10 +75,14 @@ class ExtractedFormula:
     specific_variables: Dict[str, str]
     variant_specific: bool = False
     applicable_variants: List[str] = None
+    # variables renamed to their canonical names, e.g. {"ISSUE_AGE": "ENTRY_AGE"}
+    resolved_aliases: Dict[str, str] = None
     
     def __post_init__(self):
         if self.applicable_variants is None:
             self.applicable_variants = []
+        if self.resolved_aliases is None:
+            self.resolved_aliases = {}
     
     def to_dict(self):
         return asdict(self)
@@ -144,11 +108,15 @@ class DocumentFormulaExtractor:
         self.input_variables = {}
         self.output_variables = []
         self.variants_detected = []
+        self.alias_index = ALIAS_INDEX
         
     def set_custom_variables(self, input_vars: Dict[str, str], output_vars: List[str]):
         """Set custom input and output variables"""
         self.input_variables = input_vars
         self.output_variables = output_vars
+        # Document terms and generic names resolve to the custom variable of their alias group
+        ALIAS_INDEX.refresh()
+        self.alias_index = ALIAS_INDEX.with_terms(list(input_vars) + list(output_vars))
         print(f"📝 Custom variables set: {len(input_vars)} inputs, {len(output_vars)} outputs")
         
     def extract_formulas_from_document(self, text: str) -> DocumentExtractionResult:
@@ -198,6 +166,35 @@ class DocumentFormulaExtractor:
             print(f"Traceback: {traceback.format_exc()}")
             return self._explain_no_extraction()
     
+    def stream_formulas_from_document(self, text: str) -> Iterator[Tuple[str, object]]:
+        """Extract formulas like extract_formulas_from_document, yielding each one as soon as it is parsed.
+
+        Yields ("variants", [...]) once, then ("formula", ExtractedFormula)
+        for every parsed section and ("error", message) for failed outputs.
+        """
+        if MOCK_MODE or not API_KEY:
+            return
+
+        # Variant detection and section identification are independent model calls
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            variants_future = executor.submit(self._detect_variants, text)
+            sections_future = executor.submit(self._identify_formula_sections, text)
+            self.variants_detected = variants_future.result()
+            formula_sections = sections_future.result()
+        print(f"🔍 Variants detected: {self.variants_detected}")
+        yield "variants", self.variants_detected
+
+        for formula_name in self.output_variables:
+            print(f"🔍 Streaming extraction: {formula_name}")
+            try:
+                for formula in self._stream_formula_with_variants(text, formula_name, formula_sections):
+                    yield "formula", formula
+            except Exception as e:
+                print(f"Error extracting {formula_name}: {e}")
+                yield "error", f"Error extracting {formula_name}: {str(e)}"
+
+            time.sleep(0.2)  # Rate limiting
+
     def _detect_variants(self, text: str) -> List[str]:
         """Detect product variants in the document"""
         
@@ -238,6 +235,24 @@ class DocumentFormulaExtractor:
     def _extract_formula_with_variants(self, text: str, formula_name: str, formula_sections: List[str]) -> List[ExtractedFormula]:
         """Extract formula considering variants"""
         
+        prompt = self._build_formula_prompt(text, formula_name, formula_sections)
+        
+        try:
+            model = genai.GenerativeModel('gemini-1.5-flash')
+            response = model.generate_content(prompt)
+            
+            if "NOT_FOUND" in response.text:
+                return []
+                
+            return self._parse_variant_formula_response(response.text, formula_name)
+            
+        except Exception as e:
+            print(f"Error extracting {formula_name}: {e}")
+            return []
+    
+    def _build_formula_prompt(self, text: str, formula_name: str, formula_sections: List[str]) -> str:
+        """Build the extraction prompt for one output variable"""
+        
         search_text = "\n".join(formula_sections) if formula_sections else text
         
         # Create variable mapping prompt
@@ -274,34 +289,31 @@ class DocumentFormulaExtractor:
         
         If formula not found, return "NOT_FOUND"
         """
-        
-        try:
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
-            
-            if "NOT_FOUND" in response.text:
-                return []
-                
-            return self._parse_variant_formula_response(response.text, formula_name)
-            
-        except Exception as e:
-            print(f"Error extracting {formula_name}: {e}")
-            return []
+        return prompt
     
+    def _stream_formula_with_variants(self, text: str, formula_name: str, formula_sections: List[str]) -> Iterator[ExtractedFormula]:
+        """Stream the model response and parse each completed `---` section as it arrives"""
+
+        prompt = self._build_formula_prompt(text, formula_name, formula_sections)
+        model = genai.GenerativeModel('gemini-1.5-flash')
+        response = model.generate_content(prompt, stream=True)
+
+        buffer = ""
+        for chunk in response:
+            buffer += chunk.text
+            *completed, buffer = buffer.split('---')
+            for section in completed:
+                if "NOT_FOUND" in section:
+                    return
+                if section.strip():
+                    yield from self._parse_variant_formula_response(section, formula_name)
+
+        if buffer.strip() and "NOT_FOUND" not in buffer:
+            yield from self._parse_variant_formula_response(buffer, formula_name)
+
     def _create_variable_context(self) -> str:
-        """Create context for variable mapping"""
-        context = "VARIABLE MAPPING CONTEXT:\n"
-        
-        # Add custom variables
-        for var_name, description in self.input_variables.items():
-            context += f"{var_name}: {description}\n"
-        
-        # Add generic terms for reference
-        context += "\nGENERIC INSURANCE TERMS (for reference):\n"
-        for term, desc in self.generic_terms.items():
-            context += f"{term}: {desc}\n"
-            
-        return context
+        """Create context for variable mapping (rendered once per variable set)"""
+        return render_variable_context(self.input_variables)
     
     def _parse_variant_formula_response(self, response_text: str, formula_name: str) -> List[ExtractedFormula]:
         """Parse variant-aware formula response"""
@@ -323,6 +335,9 @@ class DocumentFormulaExtractor:
                 # Extract formula
                 formula_match = re.search(r'FORMULA:\s*(.+?)(?=\nVARIABLES_USED|$)', section, re.DOTALL | re.IGNORECASE)
                 formula_expression = formula_match.group(1).strip() if formula_match else "Formula not found"
+                resolved_aliases = {}
+                if formula_match and is_valid_formula(formula_expression):
+                    formula_expression, resolved_aliases = canonicalize_expression(formula_expression, self.alias_index)
                 
                 # Extract variables used
                 variables_match = re.search(r'VARIABLES_USED:\s*(.+?)(?=\nDOCUMENT_EVIDENCE|$)', section, re.IGNORECASE)
@@ -359,7 +374,8 @@ class DocumentFormulaExtractor:
                     document_evidence=document_evidence,
                     specific_variables=specific_variables,
                     variant_specific=variant_specific,
-                    applicable_variants=applicable_variants
+                    applicable_variants=applicable_variants,
+                    resolved_aliases=resolved_aliases
                 )
                 
                 extracted_formulas.append(extracted_formula)
@@ -409,8 +425,13 @@ class DocumentFormulaExtractor:
             var_names = [var.strip() for var in variables_str.split(',')]
             
             for var_name in var_names:
+                match = self.alias_index.resolve(var_name, fuzzy=False) if var_name not in self.input_variables else None
+                if match is not None and match.method != 'generic':
+                    var_name = match.target
                 if var_name in self.input_variables:
                     specific_variables[var_name] = self.input_variables[var_name]
+                elif var_name in GENERIC_INSURANCE_TERMS:
+                    specific_variables[var_name] = GENERIC_INSURANCE_TERMS[var_name]
                 else:
                     specific_variables[var_name] = f"Variable: {var_name}"
         
@@ -429,40 +450,71 @@ class DocumentFormulaExtractor:
             variants_detected=[]
         )
 
-# Initialize the document extractor
-document_extractor = DocumentFormulaExtractor()
+@lru_cache(maxsize=32)
+def _render_variable_context(input_items: Tuple[Tuple[str, str], ...]) -> str:
+    context = "VARIABLE MAPPING CONTEXT:\n"
+    
+    # Add custom variables
+    for var_name, description in input_items:
+        context += f"{var_name}: {description}\n"
+    
+    # Add generic terms for reference
+    context += "\nGENERIC INSURANCE TERMS (for reference):\n"
+    for term, desc in GENERIC_INSURANCE_TERMS.items():
+        context += f"{term}: {desc}\n"
+        
+    return context
+
+def render_variable_context(input_variables: Dict[str, str]) -> str:
+    """Variable mapping context for the prompts, shared by every extractor with the same variables"""
+    return _render_variable_context(tuple((str(name), str(desc)) for name, desc in input_variables.items()))
+
+def is_valid_formula(expr: str) -> bool:
+    """Whether the formula engine can compile an expression; prose answers are not renamed"""
+    try:
+        compile_formula(expr)
+        return True
+    except FormulaCompileError:
+        return False
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_file(filepath):
-    """Extract text from supported file formats"""
+def extract_document(filepath, prefix: str = '', index: Optional[AliasIndex] = None) -> Tuple[str, List[ExtractedTable]]:
+    """Extract text and tables from supported file formats.
+
+    Tables are parsed locally; factor grids appear in the text only as a
+    one-line reference, other tables as compact rows. Unnamed grids are
+    named with `prefix` and their keys resolved through `index`.
+    """
     try:
         file_extension = os.path.splitext(filepath)[1].lower()
         
         if file_extension == '.pdf':
-            return extract_text_from_pdf_lib(filepath)
+            try:
+                return extract_pdf(filepath, prefix, index)
+            except Exception as e:
+                print(f"Table extraction failed, using plain PDF text: {e}")
+                return extract_text_from_pdf_lib(filepath), []
         
         elif file_extension == '.txt':
             with open(filepath, 'r', encoding='utf-8') as file:
-                return file.read()
+                return file.read(), []
         
         elif file_extension == '.docx':
             try:
-                import docx
-                doc = docx.Document(filepath)
-                return '\n'.join([paragraph.text for paragraph in doc.paragraphs])
+                return extract_docx(filepath, prefix, index)
             except ImportError:
                 print("python-docx not installed. Install with: pip install python-docx")
-                return ""
+                return "", []
         
         else:
-            return ""
+            return "", []
             
     except Exception as e:
         print(f"Error extracting text from file: {e}")
-        return ""
+        return "", []
 
 @app.route('/', methods=['GET'])
 def health_check():
@@ -479,8 +531,14 @@ def health_check():
             "Consistent variable formatting",
             "Variant-specific formula extraction",
             "Editable formulas",
-            "Generic insurance terms dictionary"
-        ]
+            "Generic insurance terms dictionary",
+            "Streaming extraction (/upload-stream)",
+            "Batch extraction of several documents (/upload-batch)",
+            "Local alias resolution of variable names (/aliases)",
+            "Boilerplate removal before extraction",
+            "Table extraction from DOCX/PDF (/document-tables)"
+        ],
+        "processor_transport": processor_client.transport
     })
 
 @app.route('/generic-terms', methods=['GET'])
@@ -491,97 +549,169 @@ def get_generic_terms():
         "count": len(GENERIC_INSURANCE_TERMS)
     })
 
+@dataclass
+class UploadedDocument:
+    filename: str
+    text: str
+    input_variables: Dict[str, str]
+    output_variables: List[str]
+    preprocessing: Optional[Dict] = None
+    tables: List[ExtractedTable] = field(default_factory=list)
+
+    def factor_tables(self) -> List[Dict]:
+        """This document's factor tables, in the form /forward-formulas takes back with the formulas"""
+        return [table.factor_table.to_dict() for table in self.tables if table.factor_table is not None]
+
+def read_variables_form():
+    """Custom variables from the form; returns ((inputs, outputs), None) or (None, error response)"""
+    input_variables_json = request.form.get('input_variables', '{}')
+    output_variables_json = request.form.get('output_variables', '[]')
+    
+    try:
+        return (json.loads(input_variables_json), json.loads(output_variables_json)), None
+    except json.JSONDecodeError:
+        return None, (jsonify({
+            "message": "Invalid JSON in variables data",
+            "status": "error"
+        }), 400)
+
+def unsupported_file_response():
+    supported_types = ', '.join(ALLOWED_EXTENSIONS)
+    return jsonify({
+        "message": f"Unsupported file type. Supported types: {supported_types}", 
+        "status": "error"
+    }), 400
+
+def save_upload(file) -> Tuple[str, str]:
+    """Save an uploaded file under a unique path; returns (filename, filepath)"""
+    filename = secure_filename(file.filename)
+    # Concurrent uploads of files with the same name must not overwrite each other
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex[:8]}_{filename}")
+    file.save(filepath)
+    print(f"📄 File saved: {filepath}")
+    return filename, filepath
+
+def load_document(filename: str, filepath: str, input_variables: Dict[str, str], output_variables: List[str],
+                  preprocess: bool = True) -> UploadedDocument:
+    """Extract, index and clean a saved upload, then delete the file; text is empty if nothing was extracted"""
+    # Extract text and tables; table keys resolve to the custom variables where they can
+    ALIAS_INDEX.refresh()
+    index = ALIAS_INDEX.with_terms(list(input_variables) + list(output_variables))
+    text, tables = extract_document(filepath, document_prefix(filename), index)
+
+    # Clean up uploaded file
+    try:
+        os.remove(filepath)
+    except:
+        pass
+
+    if not text.strip():
+        return UploadedDocument(filename, "", input_variables, output_variables)
+
+    print(f"📝 Extracted text from {filename}: {len(text)} characters")
+
+    if tables:
+        factor_count = sum(table.factor_table is not None for table in tables)
+        print(f"📊 Tables found: {len(tables)} ({factor_count} factor tables indexed)")
+
+    # Strip repeated headers, footers and disclaimers before the text goes into every prompt
+    preprocessing = None
+    if preprocess:
+        text, stats = preprocess_document_text(text)
+        preprocessing = stats.to_dict()
+        print(f"🧹 Preprocessed text: {stats.chars_before} → {stats.chars_after} characters "
+              f"({preprocessing['reduction_percent']}% smaller)")
+
+    return UploadedDocument(filename, text, input_variables, output_variables, preprocessing, tables)
+
+def read_upload_request():
+    """Validate an upload request and extract its text.
+
+    Returns (UploadedDocument, None) or (None, error response).
+    """
+    # Get form data
+    if 'file' not in request.files:
+        return None, (jsonify({"message": "No file part", "status": "error"}), 400)
+
+    file = request.files['file']
+    if file.filename == '':
+        return None, (jsonify({"message": "No selected file", "status": "error"}), 400)
+
+    if not file or not allowed_file(file.filename):
+        return None, unsupported_file_response()
+
+    # Get custom variables from form data
+    variables, error = read_variables_form()
+    if error:
+        return None, error
+    input_variables, output_variables = variables
+
+    # Process file
+    filename, filepath = save_upload(file)
+    upload = load_document(filename, filepath, input_variables, output_variables,
+                           preprocess=request.form.get('preprocess', 'true').lower() != 'false')
+
+    if not upload.text.strip():
+        return None, (jsonify({
+            "message": "Could not extract text from file or file was empty.",
+            "status": "error",
+            "formulas": []
+        }), 400)
+
+    return upload, None
+
+def formula_to_frontend(formula: ExtractedFormula) -> Dict:
+    """Convert an extracted formula to the format the frontend expects"""
+    return {
+        "id": f"{formula.formula_name}_{hash(formula.formula_expression) % 10000}",
+        "term_description": formula.formula_name,
+        "mathematical_relationship": formula.formula_expression,
+        "business_context": formula.business_context,
+        "formula_explanation": formula.document_evidence,
+        "confidence": formula.confidence,
+        "reasoning_steps": [formula.variants_info],
+        "variables_explained": formula.specific_variables,
+        "source_method": formula.source_method,
+        "variant_specific": formula.variant_specific,
+        "applicable_variants": formula.applicable_variants,
+        "resolved_aliases": formula.resolved_aliases,
+        "editable": True
+    }
+
+def extraction_status(extraction_result: DocumentExtractionResult) -> Tuple[str, str]:
+    """Message and status for an extraction result"""
+    if not MOCK_MODE and extraction_result.extracted_formulas:
+        return f"Successfully extracted {len(extraction_result.extracted_formulas)} formulas from document.", "success"
+    elif not MOCK_MODE and not extraction_result.extracted_formulas:
+        return "Document processed but no clear formulas found.", "warning"
+    return "API key required for document analysis.", "error"
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Enhanced document-based formula extraction with custom variables"""
     try:
         print("📋 Starting enhanced document-based formula extraction...")
         
-        # Get form data
-        if 'file' not in request.files:
-            return jsonify({"message": "No file part", "status": "error"}), 400
-
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({"message": "No selected file", "status": "error"}), 400
+        upload, error = read_upload_request()
+        if error:
+            return error
+        text = upload.text
+        filename = upload.filename
+        input_variables = upload.input_variables
+        output_variables = upload.output_variables
 
-        if not file or not allowed_file(file.filename):
-            supported_types = ', '.join(ALLOWED_EXTENSIONS)
-            return jsonify({
-                "message": f"Unsupported file type. Supported types: {supported_types}", 
-                "status": "error"
-            }), 400
-
-        # Get custom variables from form data
-        input_variables_json = request.form.get('input_variables', '{}')
-        output_variables_json = request.form.get('output_variables', '[]')
-        
-        try:
-            input_variables = json.loads(input_variables_json)
-            output_variables = json.loads(output_variables_json)
-        except json.JSONDecodeError:
-            return jsonify({
-                "message": "Invalid JSON in variables data",
-                "status": "error"
-            }), 400
-
-        # Set custom variables in extractor
-        document_extractor.set_custom_variables(input_variables, output_variables)
-
-        # Process file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        print(f"📄 File saved: {filepath}")
-
-        # Extract text
-        text = extract_text_from_file(filepath)
-        if not text.strip():
-            return jsonify({
-                "message": "Could not extract text from file or file was empty.",
-                "status": "error",
-                "formulas": []
-            }), 400
-
-        print(f"📝 Extracted text: {len(text)} characters")
+        # Each request gets its own extractor, so concurrent uploads keep their own variables
+        extractor = DocumentFormulaExtractor()
+        extractor.set_custom_variables(input_variables, output_variables)
 
         # Extract formulas from document
-        extraction_result = document_extractor.extract_formulas_from_document(text)
-        
-        # Clean up uploaded file
-        try:
-            os.remove(filepath)
-        except:
-            pass
+        extraction_result = extractor.extract_formulas_from_document(text)
 
         # Convert to frontend format
-        frontend_formulas = []
-        for formula in extraction_result.extracted_formulas:
-            frontend_formulas.append({
-                "id": f"{formula.formula_name}_{hash(formula.formula_expression) % 10000}",
-                "term_description": formula.formula_name,
-                "mathematical_relationship": formula.formula_expression,
-                "business_context": formula.business_context,
-                "formula_explanation": formula.document_evidence,
-                "confidence": formula.confidence,
-                "reasoning_steps": [formula.variants_info],
-                "variables_explained": formula.specific_variables,
-                "source_method": formula.source_method,
-                "variant_specific": formula.variant_specific,
-                "applicable_variants": formula.applicable_variants,
-                "editable": True
-            })
+        frontend_formulas = [formula_to_frontend(formula) for formula in extraction_result.extracted_formulas]
 
         # Determine status
-        if not MOCK_MODE and extraction_result.extracted_formulas:
-            message = f"Successfully extracted {len(extraction_result.extracted_formulas)} formulas from document."
-            status = "success"
-        elif not MOCK_MODE and not extraction_result.extracted_formulas:
-            message = "Document processed but no clear formulas found."
-            status = "warning"
-        else:
-            message = "API key required for document analysis."
-            status = "error"
+        message, status = extraction_status(extraction_result)
 
         return jsonify({
             "message": message,
@@ -593,6 +723,9 @@ def upload_file():
             "variants_detected": extraction_result.variants_detected,
             "input_variables": input_variables,
             "output_variables": output_variables,
+            "preprocessing": upload.preprocessing,
+            "tables": [table.describe() for table in upload.tables],
+            "factor_tables": upload.factor_tables(),
             "api_key_configured": not MOCK_MODE
         }), 200
         
@@ -605,6 +738,167 @@ def upload_file():
             "formulas": []
         }), 500
 
+@app.route('/upload-stream', methods=['POST'])
+def upload_file_stream():
+    """Streaming variant of /upload.
+
+    Responds with newline-delimited JSON: a "started" event once variants are
+    detected, a "formula" event for every formula as soon as it is parsed
+    from the model's streamed output, and a final "done" event.
+    """
+    try:
+        print("📋 Starting streaming document-based formula extraction...")
+
+        upload, error = read_upload_request()
+        if error:
+            return error
+
+        extractor = DocumentFormulaExtractor()
+        extractor.set_custom_variables(upload.input_variables, upload.output_variables)
+    except Exception as e:
+        print(f"❌ Upload processing failed: {e}")
+        return jsonify({"message": f"Processing failed: {str(e)}", "status": "error", "formulas": []}), 500
+
+    def generate():
+        if MOCK_MODE:
+            yield json.dumps({"event": "done", "status": "error", "message": "API key required for document analysis.",
+                              "total_formulas": 0, "api_key_configured": False}) + "\n"
+            return
+
+        total = 0
+        try:
+            for kind, payload in extractor.stream_formulas_from_document(upload.text):
+                if kind == "variants":
+                    yield json.dumps({"event": "started", "variants_detected": payload,
+                                      "file_type": os.path.splitext(upload.filename)[1].lower(),
+                                      "preprocessing": upload.preprocessing,
+                                      "tables": [table.describe() for table in upload.tables],
+                                      "factor_tables": upload.factor_tables()}) + "\n"
+                elif kind == "formula":
+                    total += 1
+                    yield json.dumps({"event": "formula", "formula": formula_to_frontend(payload)}) + "\n"
+                else:
+                    yield json.dumps({"event": "error", "message": payload}) + "\n"
+        except Exception as e:
+            print(f"❌ Streaming extraction failed: {e}")
+            print(f"Traceback: {traceback.format_exc()}")
+            yield json.dumps({"event": "error", "message": f"Processing failed: {str(e)}"}) + "\n"
+
+        yield json.dumps({
+            "event": "done",
+            "status": "success" if total else "warning",
+            "message": f"Successfully extracted {total} formulas from document." if total
+                       else "Document processed but no clear formulas found.",
+            "total_formulas": total,
+            "variants_detected": extractor.variants_detected,
+            "input_variables": upload.input_variables,
+            "output_variables": upload.output_variables,
+            "api_key_configured": True
+        }) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def extract_batch_document(filename: str, filepath: str, input_variables: Dict[str, str], output_variables: List[str],
+                           preprocess: bool) -> Dict:
+    """Extract one document of a batch with its own extractor; returns its result group"""
+    try:
+        upload = load_document(filename, filepath, input_variables, output_variables, preprocess)
+        if not upload.text.strip():
+            return {"filename": filename, "status": "error", "formulas": [], "total_formulas": 0,
+                    "message": "Could not extract text from file or file was empty."}
+
+        extractor = DocumentFormulaExtractor()
+        extractor.set_custom_variables(input_variables, output_variables)
+        extraction_result = extractor.extract_formulas_from_document(upload.text)
+        message, status = extraction_status(extraction_result)
+        formulas = [formula_to_frontend(formula) for formula in extraction_result.extracted_formulas]
+        return {
+            "filename": filename,
+            "status": status,
+            "message": message,
+            "file_type": os.path.splitext(filename)[1].lower(),
+            "formulas": formulas,
+            "total_formulas": len(formulas),
+            "variants_detected": extraction_result.variants_detected,
+            "preprocessing": upload.preprocessing,
+            "tables": [table.describe() for table in upload.tables],
+            "factor_tables": upload.factor_tables()
+        }
+    except Exception as e:
+        print(f"❌ Batch extraction failed for {filename}: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return {"filename": filename, "status": "error", "formulas": [], "total_formulas": 0,
+                "message": f"Processing failed: {str(e)}"}
+
+@app.route('/upload-batch', methods=['POST'])
+def upload_batch():
+    """Extract formulas from several documents with one variable set.
+
+    Form fields: files (repeated), input_variables, output_variables and
+    optional preprocess. Documents are extracted and sent to the model
+    concurrently, each with its own extractor; the rendered variable context
+    is shared. Formulas are returned grouped by document, in upload order.
+    """
+    try:
+        files = [file for file in request.files.getlist('files') + request.files.getlist('file') if file.filename]
+        if not files:
+            return jsonify({"message": "No files uploaded", "status": "error"}), 400
+        if len(files) > BATCH_MAX_FILES:
+            return jsonify({"message": f"At most {BATCH_MAX_FILES} files per batch", "status": "error"}), 400
+        if not all(allowed_file(file.filename) for file in files):
+            return unsupported_file_response()
+
+        variables, error = read_variables_form()
+        if error:
+            return error
+        input_variables, output_variables = variables
+        preprocess = request.form.get('preprocess', 'true').lower() != 'false'
+        print(f"📚 Starting batch extraction of {len(files)} documents...")
+
+        started = time.perf_counter()
+        # Files are read from the request here; everything after runs on the workers
+        saved = [save_upload(file) for file in files]
+        # Render the shared prompt context once before the workers need it
+        render_variable_context(input_variables)
+        with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(saved))) as executor:
+            futures = [
+                executor.submit(extract_batch_document, filename, filepath, input_variables, output_variables, preprocess)
+                for filename, filepath in saved
+            ]
+            documents = [future.result() for future in futures]
+
+        total = sum(document["total_formulas"] for document in documents)
+        failed = sum(document["status"] == "error" for document in documents)
+        if MOCK_MODE:
+            message, status = "API key required for document analysis.", "error"
+        elif failed == len(documents):
+            message, status = "No document could be processed.", "error"
+        else:
+            message = f"Extracted {total} formulas from {len(documents) - failed} of {len(documents)} documents."
+            status = "success" if total and not failed else "warning"
+
+        return jsonify({
+            "message": message,
+            "status": status,
+            "documents": documents,
+            "document_count": len(documents),
+            "total_formulas": total,
+            "input_variables": input_variables,
+            "output_variables": output_variables,
+            "elapsed_seconds": round(time.perf_counter() - started, 2),
+            "api_key_configured": not MOCK_MODE
+        }), 200
+
+    except Exception as e:
+        print(f"❌ Batch upload failed: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return jsonify({
+            "message": f"Processing failed: {str(e)}",
+            "status": "error",
+            "documents": []
+        }), 500
+
 @app.route('/save-formulas', methods=['POST'])
 def save_formulas():
     """Save edited formulas"""
@@ -627,13 +921,86 @@ def save_formulas():
             "status": "error"
         }), 500
 
+@app.route('/aliases', methods=['GET'])
+def get_aliases():
+    """Confirmed alias mappings and the size of the alias index"""
+    ALIAS_INDEX.refresh()
+    return jsonify({"confirmed": ALIAS_INDEX.confirmed(), "index": ALIAS_INDEX.describe()})
+
+@app.route('/aliases', methods=['POST'])
+def confirm_alias():
+    """Confirm that a document term or column header means a variable: {"alias": ..., "canonical": ...}"""
+    data = request.get_json(silent=True) or {}
+    alias = str(data.get('alias', '')).strip()
+    canonical = str(data.get('canonical', '')).strip()
+    if not alias or not canonical:
+        return jsonify({"message": "Both 'alias' and 'canonical' are required.", "status": "error"}), 400
+    ALIAS_INDEX.refresh()
+    if not ALIAS_INDEX.confirm(alias, canonical):
+        return jsonify({
+            "message": f"'{alias}' cannot be mapped to '{canonical}': it would create an alias cycle.",
+            "status": "error"
+        }), 409
+    return jsonify({
+        "message": f"'{alias}' now resolves to '{canonical}'",
+        "status": "success",
+        "resolved": ALIAS_INDEX.resolve(alias).to_dict()
+    }), 200
+
+@app.route('/aliases/resolve', methods=['GET'])
+def resolve_aliases():
+    """Resolve one or more terms (?term=...&term=...) against the alias index"""
+    ALIAS_INDEX.refresh()
+    resolved = {}
+    for term in request.args.getlist('term'):
+        match = ALIAS_INDEX.resolve(term)
+        resolved[term] = match.to_dict() if match else None
+    return jsonify({"resolved": resolved})
+
+@app.route('/document-tables', methods=['POST'])
+def extract_tables():
+    """Tables of one uploaded document, without extracting formulas"""
+    try:
+        upload, error = read_upload_request()
+        if error:
+            return error
+        return jsonify({
+            "filename": upload.filename,
+            "tables": [table.describe() for table in upload.tables],
+            "factor_tables": upload.factor_tables(),
+            "count": len(upload.tables)
+        })
+    except Exception as e:
+        print(f"❌ Table extraction failed: {e}")
+        return jsonify({"message": f"Table extraction failed: {str(e)}", "status": "error"}), 500
+
 @app.route('/forward-formulas', methods=['POST'])
 def forward_formulas():
-    """Forward formulas to data processing service"""
+    """Forward formulas, and the factor tables sent along with them, to data processing service"""
     try:
         data = request.get_json()
-        response = requests.post("http://127.0.0.1:5001/store-formulas", json=data)
-        return jsonify(response.json()), response.status_code
+        # Only the tables of the documents this formula set came from, as returned by the upload
+        table_data = (data.get('factor_tables') or []) if isinstance(data, dict) else []
+        if not isinstance(table_data, list):
+            raise HandoffError("'factor_tables' must be a list of factor tables")
+        factor_tables = [FactorTable.from_dict(table) for table in table_data]
+
+        body, status = processor_client.store_formulas(data)
+
+        forwarded_tables = 0
+        if status == 200:
+            for table in factor_tables:
+                stored, error = processor_client.store_factor_table(table)
+                if stored:
+                    forwarded_tables += 1
+                else:
+                    print(f"Forwarding factor table {table.name} failed: {error}")
+
+        body["factor_tables_forwarded"] = forwarded_tables
+        body["transport"] = processor_client.transport
+        return jsonify(body), status
+    except (HandoffError, FactorTableError) as e:
+        return jsonify({"message": str(e), "status": "error"}), 400
     except Exception as e:
         return jsonify({"message": f"Forwarding failed: {str(e)}"}), 500
 
@@ -658,10 +1025,24 @@ if __name__ == '__main__':
     print("📁 Supported formats:", ', '.join(ALLOWED_EXTENSIONS))
     print(f"📊 Generic insurance terms: {len(GENERIC_INSURANCE_TERMS)}")
     print("✅ Features: Custom variables, Variant detection, Editable formulas")
-    
+
+    if IN_PROCESS_PROCESSOR:
+        import threading
+        import formula_processor
+        print("🧮 Formula Processor running in-process on http://127.0.0.1:5001")
+        threading.Thread(
+            target=formula_processor.app.run,
+            kwargs={"host": '127.0.0.1', "port": 5001, "threaded": True, "use_reloader": False},
+            daemon=True
+        ).start()
+    else:
+        print(f"🧮 Formula Processor at {PROCESSOR_URL}")
+
     app.run(
         host='127.0.0.1',
         port=5000,
         debug=True,
-        threaded=True
+        threaded=True,
+        # The reloader restarts in a child process, which would start a second processor
+        use_reloader=not IN_PROCESS_PROCESSOR
     )
\ No newline at end of file
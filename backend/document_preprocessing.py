@@ -0,0 +1,174 @@
+"""Clean extracted document text before it is sent to the model.
+
+pdfminer and python-docx return every page header, footer and disclaimer,
+and the text is re-sent with every prompt. This removes repeated boilerplate
+and layout noise locally so each model call carries less text.
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import List, Tuple
+
+# A line on at least this share of pages is a running header or footer
+PAGE_REPEAT_SHARE = 0.5
+# Headers and footers are looked for among this many lines at each end of a page
+PAGE_EDGE_LINES = 3
+# Lines up to this length match across pages with their numbers ignored
+MAX_NUMBERED_LINE_CHARS = 40
+# Outside page structure, a line seen this many times is boilerplate
+LINE_REPEAT_LIMIT = 3
+# Shorter lines (table cells, labels) are never deduplicated
+MIN_LINE_CHARS = 20
+# Paragraphs shorter than this are never treated as repeated blocks
+MIN_BLOCK_CHARS = 80
+
+_LIGATURES = {'\ufb00': 'ff', '\ufb01': 'fi', '\ufb02': 'fl', '\ufb03': 'ffi', '\ufb04': 'ffl'}
+_SPACES = re.compile(r'[ \t\u00a0\u2000-\u200a\u202f\u205f\u3000]+')
+_SOFT_HYPHEN = '\u00ad'
+_HYPHEN_BREAK = re.compile(r'([A-Za-z]+)[-\u2010]$')
+# Word parts that keep their hyphen when a line breaks after them ("non-guaranteed")
+_COMPOUND_PREFIXES = {
+    'anti', 'co', 'cross', 'ex', 'half', 'inter', 'joint', 'mid', 'multi', 'non', 'over',
+    'part', 'post', 'pre', 'pro', 'quasi', 're', 'self', 'semi', 'single', 'sub', 'under', 'well'
+}
+_DIGITS = re.compile(r'\d+')
+_BLANK_LINES = re.compile(r'\n{3,}')
+_LETTERS = re.compile(r'[A-Za-z]{3}')
+
+@dataclass
+class PreprocessStats:
+    chars_before: int = 0
+    chars_after: int = 0
+    pages: int = 1
+    repeated_lines_removed: int = 0
+    repeated_blocks_removed: int = 0
+    hyphenations_joined: int = 0
+
+    def to_dict(self):
+        stats = asdict(self)
+        stats["reduction_percent"] = (
+            round(100.0 * (1 - self.chars_after / self.chars_before), 1) if self.chars_before else 0.0
+        )
+        return stats
+
+def _page_key(line: str) -> str:
+    line = line.strip().lower()
+    # Page numbers and dates change from page to page in short lines like "Page 3 of 12";
+    # longer lines must repeat exactly so templated content is kept
+    return _DIGITS.sub('#', line) if len(line) <= MAX_NUMBERED_LINE_CHARS else line
+
+def _page_edges(lines: List[str]) -> set:
+    """Positions of the first and last non-empty lines of a page"""
+    filled = [pos for pos, line in enumerate(lines) if line.strip()]
+    return set(filled[:PAGE_EDGE_LINES]) | set(filled[-PAGE_EDGE_LINES:])
+
+def _is_formula_line(line: str) -> bool:
+    return '=' in line
+
+def _is_line_break_hyphen(line: str, next_line: str) -> bool:
+    """A hard hyphen at the end of `line` that only splits a word across the break"""
+    match = _HYPHEN_BREAK.search(line)
+    return (
+        match is not None
+        and next_line[:1].isascii() and next_line[:1].islower()
+        and match.group(1).lower() not in _COMPOUND_PREFIXES
+        # "Sum-" at the end of a formula line is more likely "Sum-assured" than a split word
+        and not _is_formula_line(line) and not _is_formula_line(next_line)
+    )
+
+def _join_hyphenations(page: str, stats: PreprocessStats) -> str:
+    """Join words split across lines by a soft hyphen, or by a hard one that is not part of the word"""
+    lines = page.split('\n')
+    joined = [lines[0]]
+    for line in lines[1:]:
+        previous = joined[-1]
+        if (line and previous.endswith(_SOFT_HYPHEN)) or _is_line_break_hyphen(previous, line):
+            joined[-1] = previous[:-1] + line
+            stats.hyphenations_joined += 1
+        else:
+            joined.append(line)
+    return '\n'.join(joined).replace(_SOFT_HYPHEN, '')
+
+def _remove_page_furniture(pages: List[str], stats: PreprocessStats) -> List[str]:
+    """Drop lines that recur on most pages (running headers, footers, page numbers)"""
+    if len(pages) < 3:
+        return pages
+    split_pages = [page.split('\n') for page in pages]
+    pages_with_line = Counter()
+    for lines in split_pages:
+        pages_with_line.update({_page_key(lines[pos]) for pos in _page_edges(lines)})
+    threshold = max(3, PAGE_REPEAT_SHARE * len(pages))
+    furniture = {key for key, count in pages_with_line.items() if count >= threshold}
+
+    cleaned = []
+    for lines in split_pages:
+        edges = _page_edges(lines)
+        kept = []
+        for pos, line in enumerate(lines):
+            if pos in edges and _page_key(line) in furniture and not _is_formula_line(line):
+                stats.repeated_lines_removed += 1
+            else:
+                kept.append(line)
+        cleaned.append('\n'.join(kept))
+    return cleaned
+
+def _is_boilerplate_candidate(line: str) -> bool:
+    line = line.strip()
+    return len(line) >= MIN_LINE_CHARS and bool(_LETTERS.search(line)) and not _is_formula_line(line)
+
+def _remove_repeated_lines(text: str, stats: PreprocessStats) -> str:
+    """Keep the first occurrence of a line that keeps coming back, outside formulas"""
+    lines = text.split('\n')
+    counts = Counter(line.lower() for line in lines if _is_boilerplate_candidate(line))
+    seen = set()
+    kept = []
+    for line in lines:
+        key = line.lower()
+        if counts.get(key, 0) >= LINE_REPEAT_LIMIT:
+            if key in seen:
+                stats.repeated_lines_removed += 1
+                continue
+            seen.add(key)
+        kept.append(line)
+    return '\n'.join(kept)
+
+def _remove_repeated_blocks(text: str, stats: PreprocessStats) -> str:
+    """Keep the first copy of a repeated paragraph such as a disclaimer"""
+    seen = set()
+    kept = []
+    for block in text.split('\n\n'):
+        key = ' '.join(block.split()).lower()
+        if len(key) >= MIN_BLOCK_CHARS and not _is_formula_line(block):
+            if key in seen:
+                stats.repeated_blocks_removed += 1
+                continue
+            seen.add(key)
+        kept.append(block)
+    return '\n\n'.join(kept)
+
+def preprocess_document_text(text: str) -> Tuple[str, PreprocessStats]:
+    """Normalize whitespace and hyphenation and strip repeated boilerplate"""
+    stats = PreprocessStats(chars_before=len(text))
+
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    for ligature, letters in _LIGATURES.items():
+        text = text.replace(ligature, letters)
+
+    # pdfminer separates pages with a form feed
+    pages = text.split('\f')
+    stats.pages = len(pages)
+    pages = [
+        '\n'.join(_SPACES.sub(' ', line).strip() for line in page.split('\n'))
+        for page in pages
+    ]
+    pages = [_join_hyphenations(page, stats) for page in pages]
+    pages = _remove_page_furniture(pages, stats)
+    text = '\n'.join(pages)
+
+    text = _BLANK_LINES.sub('\n\n', text)
+    text = _remove_repeated_blocks(text, stats)
+    text = _remove_repeated_lines(text, stats)
+    text = _BLANK_LINES.sub('\n\n', text).strip()
+
+    stats.chars_after = len(text)
+    return text, stats
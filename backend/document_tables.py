@@ -0,0 +1,324 @@
+"""Structured table extraction from DOCX and PDF documents.
+
+Factor grids and variant tables are parsed locally into rows instead of being
+sent to the model as flattened numbers. Factor tables are indexed as
+FactorTable objects so formulas can use them; the document text only keeps a
+one-line reference to each, while small tables are rendered inline as rows.
+Key labels are resolved to variable names through the alias index, and grids
+without a *_FACTOR name are named after their document.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Tuple
+
+import pandas as pd
+
+from alias_index import ALIAS_INDEX, AliasIndex
+from factor_tables import FactorTable, FactorTableError
+
+# Tables longer than this are referenced instead of rendered inline
+MAX_INLINE_ROWS = 40
+# Share of numeric body cells for a table to count as a factor grid
+FACTOR_NUMERIC_SHARE = 0.8
+# Text lines whose vertical centres are this close (in points) form one row
+PDF_ROW_TOLERANCE = 3.0
+
+_NUMBER = re.compile(r'^[-+]?(\d{1,3}(,\d{3})+|\d+)?(\.\d+)?%?$')
+_FACTOR_NAME = re.compile(r'\b[A-Z][A-Z0-9]*(?:_[A-Z0-9]+)*_FACTOR\b')
+_VARIANT_WORDS = re.compile(r'\b(variant|plan|option|cover code)\b', re.IGNORECASE)
+_AXIS_SEPARATORS = re.compile(r'\s*(?:/|\\|×|\bx\b|\bvs\.?\b)\s*', re.IGNORECASE)
+
+@dataclass
+class ExtractedTable:
+    index: int
+    header: List[str]
+    rows: List[List[str]]
+    caption: str = ''
+    page: Optional[int] = None
+    kind: str = 'other'  # 'factor', 'variant' or 'other'
+    name: Optional[str] = None
+    factor_table: Optional[FactorTable] = field(default=None, repr=False)
+    # Key labels that match no known variable; formulas cannot supply them as is
+    unresolved_keys: List[str] = field(default_factory=list)
+
+    def describe(self) -> Dict:
+        summary = {
+            "index": self.index,
+            "kind": self.kind,
+            "name": self.name,
+            "caption": self.caption,
+            "page": self.page,
+            "columns": self.header,
+            "row_count": len(self.rows)
+        }
+        if self.factor_table is not None:
+            summary["factor_table"] = self.factor_table.describe()
+            summary["unresolved_keys"] = self.unresolved_keys
+        elif len(self.rows) <= MAX_INLINE_ROWS:
+            summary["rows"] = self.rows
+        return summary
+
+    def render(self) -> str:
+        """Compact text for the prompt: a reference for factor grids, rows otherwise"""
+        if self.factor_table is not None:
+            table = self.factor_table
+            keys = ', '.join(_upper_snake(key) for key in table.key_columns)
+            shape = ' x '.join(str(size) for size in table.grid.shape)
+            return (f"[Table {self.name}: factor table indexed separately, keys {keys}, {shape} values. "
+                    f"Use {self.name} as a variable in formulas.]")
+        lines = [f"[Table {self.index + 1}{': ' + self.caption if self.caption else ''}]",
+                 ' | '.join(self.header)]
+        lines += [' | '.join(row) for row in self.rows[:MAX_INLINE_ROWS]]
+        if len(self.rows) > MAX_INLINE_ROWS:
+            lines.append(f"... ({len(self.rows) - MAX_INLINE_ROWS} more rows)")
+        return '\n'.join(lines)
+
+def _is_number(cell: str) -> bool:
+    cell = cell.strip()
+    return bool(cell) and bool(_NUMBER.match(cell)) and any(ch.isdigit() for ch in cell)
+
+def _to_number(cell: str) -> float:
+    cell = cell.strip().replace(',', '')
+    if cell.endswith('%'):
+        return float(cell[:-1]) / 100.0
+    return float(cell)
+
+def _upper_snake(text: str) -> str:
+    return re.sub(r'[^A-Za-z0-9]+', '_', text.strip()).strip('_').upper()
+
+def _table_name(caption: str, header: List[str], index: int, prefix: str = '') -> str:
+    for text in [caption] + header[:1]:
+        match = _FACTOR_NAME.search(text.upper())
+        if match:
+            return match.group(0)
+    return f"{prefix}_TABLE_{index + 1}" if prefix else f"TABLE_{index + 1}"
+
+def document_prefix(filename: str) -> str:
+    """Name prefix for a document's unnamed tables: 'Plan Brochure v2.pdf' gives PLAN_BROCHURE_V2"""
+    prefix = _upper_snake(re.sub(r'\.[A-Za-z0-9]+$', '', filename))
+    return f"DOC_{prefix}" if prefix[:1].isdigit() else prefix
+
+def _key_name(label: str, index: AliasIndex, context: str = '') -> Tuple[str, bool]:
+    """Variable a key label stands for, and whether the alias index knows it.
+
+    A label that does not resolve on its own is retried with the leading
+    words of `context`, the first axis of the header: in "Policy Year / Term"
+    the column key is the policy term.
+    """
+    words = context.split()
+    candidates = [label] + [' '.join(words[:count] + [label]) for count in range(len(words) - 1, 0, -1)]
+    for candidate in candidates:
+        match = index.resolve(candidate, fuzzy=False)
+        if match is not None:
+            # An unconfirmed generic alias may name another quantity, so keep the term's own name
+            return _upper_snake(match.chain[0] if match.method == 'generic' else match.target), True
+    return _upper_snake(label), False
+
+def classify(table: ExtractedTable, prefix: str = ''):
+    """Decide whether a table is a factor grid, a variant table or anything else"""
+    body = [row for row in table.rows if any(cell.strip() for cell in row)]
+    values = [cell for row in body for cell in row[1:]]
+    numeric_share = sum(_is_number(cell) for cell in values) / len(values) if values else 0.0
+    if (len(body) >= 2 and len(table.header) >= 2 and numeric_share >= FACTOR_NUMERIC_SHARE
+            and all(_is_number(row[0]) for row in body)):
+        table.kind = 'factor'
+        table.name = _table_name(table.caption, table.header, table.index, prefix)
+    elif _VARIANT_WORDS.search(' '.join(table.header + [row[0] for row in body if row])):
+        table.kind = 'variant'
+
+def to_factor_table(table: ExtractedTable, index: Optional[AliasIndex] = None) -> Optional[FactorTable]:
+    """Index a factor grid: wide when the header holds numeric keys, long otherwise"""
+    index = index or ALIAS_INDEX
+    width = len(table.header)
+    rows = [row + [''] * (width - len(row)) for row in table.rows]
+    table.unresolved_keys = []
+    if all(_is_number(cell) for cell in table.header[1:]):
+        axes = [part for part in _AXIS_SEPARATORS.split(table.header[0]) if part.strip()]
+        labels = axes[:2] + ['ROW_KEY', 'COLUMN_KEY'][len(axes[:2]):]
+        row_key, row_known = _key_name(labels[0], index)
+        column_key, column_known = _key_name(labels[1], index, labels[0])
+        table.unresolved_keys = [label for label, known in zip(labels, (row_known, column_known)) if not known]
+        if row_key == column_key:
+            return None
+        columns = [row_key] + [str(_to_number(cell)) for cell in table.header[1:]]
+        frame = pd.DataFrame([[_cell_value(cell) for cell in row[:width]] for row in rows], columns=columns)
+        return FactorTable.from_frame(table.name, frame, [row_key], column_key=column_key)
+
+    columns = [_upper_snake(cell) or f"COLUMN_{pos + 1}" for pos, cell in enumerate(table.header)]
+    for pos, cell in enumerate(table.header[:-1]):
+        key, known = _key_name(cell, index)
+        if known:
+            columns[pos] = key
+        else:
+            table.unresolved_keys.append(cell)
+    if len(set(columns)) != len(columns):
+        return None
+    frame = pd.DataFrame([[_cell_value(cell) for cell in row[:width]] for row in rows], columns=columns)
+    return FactorTable.from_frame(table.name, frame, columns[:-1], value_column=columns[-1])
+
+def _cell_value(cell: str):
+    return _to_number(cell) if _is_number(cell) else None
+
+def index_tables(tables: List[ExtractedTable], prefix: str = '',
+                 index: Optional[AliasIndex] = None) -> List[ExtractedTable]:
+    """Classify tables and build factor tables for the numeric grids"""
+    for table in tables:
+        classify(table, prefix)
+        if table.kind != 'factor':
+            continue
+        try:
+            table.factor_table = to_factor_table(table, index)
+        except FactorTableError as e:
+            print(f"Could not index table {table.name}: {e}")
+        if table.factor_table is None:
+            table.kind = 'other'
+        elif table.unresolved_keys:
+            print(f"Table {table.name}: keys {', '.join(table.unresolved_keys)} match no known variable")
+    return tables
+
+def _split_header(rows: List[List[str]]) -> Tuple[List[str], List[List[str]]]:
+    return (rows[0], rows[1:]) if rows else ([], [])
+
+def extract_docx(filepath: str, prefix: str = '', index: Optional[AliasIndex] = None) -> Tuple[str, List[ExtractedTable]]:
+    """Paragraph text with tables rendered in document order, plus the tables"""
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    doc = docx.Document(filepath)
+    blocks = []
+    tables = []
+    last_paragraph = ''
+    for child in doc.element.body.iterchildren():
+        tag = child.tag.rsplit('}', 1)[-1]
+        if tag == 'p':
+            text = Paragraph(child, doc).text
+            blocks.append(text)
+            if text.strip():
+                last_paragraph = text.strip()
+        elif tag == 'tbl':
+            rows = []
+            for row in Table(child, doc).rows:
+                cells = []
+                for cell in row.cells:
+                    # Merged cells repeat the same cell object across the span
+                    if cells and cells[-1][0] is cell._tc:
+                        continue
+                    cells.append((cell._tc, ' '.join(cell.text.split())))
+                rows.append([text for _, text in cells])
+            header, body = _split_header(rows)
+            if not header:
+                continue
+            table = ExtractedTable(len(tables), header, body, caption=last_paragraph)
+            tables.append(table)
+            blocks.append(table)
+
+    index_tables(tables, prefix, index)
+    text = '\n'.join(block.render() if isinstance(block, ExtractedTable) else block for block in blocks)
+    return text, tables
+
+def _pdf_cells(line) -> List[str]:
+    """Cells of one pdfminer text line, which often spans several table columns"""
+    tokens = line.get_text().split()
+    # Split off trailing numbers: "1 0.30 0.50" or "Policy Year / Term 10 15"
+    label_end = len(tokens)
+    while label_end > 0 and _is_number(tokens[label_end - 1]):
+        label_end -= 1
+    if label_end == len(tokens):
+        return [' '.join(tokens)] if tokens else []
+    label = [' '.join(tokens[:label_end])] if label_end else []
+    return label + tokens[label_end:]
+
+def _pdf_page_rows(page) -> List[Tuple[float, float, List[str], List]]:
+    """Group the text lines of a page into rows (top to bottom), cells left to right"""
+    from pdfminer.layout import LTTextContainer, LTTextLine
+
+    lines = []
+    for element in page:
+        if isinstance(element, LTTextContainer):
+            for line in element:
+                if isinstance(line, LTTextLine) and line.get_text().strip():
+                    lines.append(line)
+    lines.sort(key=lambda line: (-(line.y0 + line.y1) / 2, line.x0))
+
+    rows = []
+    for line in lines:
+        centre = (line.y0 + line.y1) / 2
+        if rows and abs(rows[-1][0] - centre) <= PDF_ROW_TOLERANCE:
+            rows[-1][2].append(line)
+        else:
+            rows.append([centre, line.y1, [line]])
+    result = []
+    for centre, top, row_lines in rows:
+        row_lines.sort(key=lambda line: line.x0)
+        cells = [cell for line in row_lines for cell in _pdf_cells(line)]
+        result.append((centre, top, cells, row_lines))
+    return result
+
+def _is_table_row(cells: List[str]) -> bool:
+    return len(cells) >= 2 and sum(_is_number(cell) for cell in cells) >= len(cells) - 1
+
+def extract_pdf(filepath: str, prefix: str = '', index: Optional[AliasIndex] = None) -> Tuple[str, List[ExtractedTable]]:
+    """Page text from pdfminer's layout analysis, with numeric grids pulled out as tables"""
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    pages = []
+    tables = []
+    for page_number, page in enumerate(extract_pages(filepath), start=1):
+        rows = _pdf_page_rows(page)
+        # Runs of rows with the same number of mostly numeric cells form a grid
+        table_rows = {}
+        start = 0
+        while start < len(rows):
+            end = start
+            width = len(rows[start][2])
+            while end < len(rows) and len(rows[end][2]) == width and _is_table_row(rows[end][2]):
+                end += 1
+            if end - start >= 2:
+                # The header is either the first row of the run (a label, then numeric keys)
+                # or a row of labels just above it
+                if not _is_number(rows[start][2][0]) and end - start >= 3:
+                    first, body_start = start, start + 1
+                elif start > 0 and len(rows[start - 1][2]) == width:
+                    first, body_start = start - 1, start
+                else:
+                    start = end
+                    continue
+                header = rows[first][2]
+                caption = ' '.join(rows[first - 1][2]) if first > 0 else ''
+                table = ExtractedTable(len(tables), header, [rows[pos][2] for pos in range(body_start, end)],
+                                       caption=caption, page=page_number)
+                tables.append(table)
+                for pos in range(first, end):
+                    table_rows[pos] = table
+                start = end
+            else:
+                start += 1
+
+        index_tables([table for table in tables if table.page == page_number], prefix, index)
+
+        # Rebuild the page text, replacing each factor grid with its reference
+        lines_in_tables = {}
+        for pos, table in table_rows.items():
+            if table.factor_table is not None:
+                for line in rows[pos][3]:
+                    lines_in_tables[id(line)] = table
+        parts = []
+        rendered = set()
+        for element in page:
+            if not isinstance(element, LTTextContainer):
+                continue
+            kept = []
+            for line in element:
+                table = lines_in_tables.get(id(line))
+                if table is None:
+                    kept.append(line.get_text())
+                elif table.index not in rendered:
+                    rendered.add(table.index)
+                    kept.append(table.render() + '\n')
+            if kept:
+                parts.append(''.join(kept))
+        pages.append('\n'.join(parts))
+
+    return '\f'.join(pages), tables
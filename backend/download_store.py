@@ -0,0 +1,169 @@
+"""Processed-file housekeeping: compressed download variants and retention.
+
+Compressed copies are made on first request and kept next to the original
+(output.xlsx.gz, output.xlsx.zst), so repeat downloads reuse them. A
+background sweeper deletes files past the age limit and the oldest files
+while the folder is over its size limit.
+"""
+import gzip
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Preferred first when the client accepts several
+ENCODING_SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+# Only serve a compressed copy that saves at least this share of the bytes
+MIN_SAVING = 0.05
+
+# One lock per compressed copy being made, so a large file only holds up requests for that file
+_compress_locks: Dict[str, threading.Lock] = {}
+_compress_locks_guard = threading.Lock()
+
+def available_encodings() -> List[str]:
+    return [encoding for encoding in ENCODING_SUFFIXES if encoding != 'zstd' or zstandard is not None]
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best encoding the client accepts (q=0 means refused)"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if token:
+            accepted[token.strip().lower()] = quality
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+def _compress(source: str, target: str, encoding: str):
+    temp = f"{target}.tmp{threading.get_ident()}"
+    with open(source, 'rb') as src, open(temp, 'wb') as dst:
+        if encoding == 'gzip':
+            with gzip.GzipFile(fileobj=dst, mode='wb', mtime=0) as zipped:
+                shutil.copyfileobj(src, zipped)
+        else:
+            zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+    os.replace(temp, target)
+
+def compressed_variant(path: str, encoding: str) -> Optional[str]:
+    """Path of the compressed copy of `path`, creating it if needed.
+
+    Returns None when the copy would not be meaningfully smaller (xlsx files
+    are already zip archives, so this is common for small outputs).
+    """
+    target = path + ENCODING_SUFFIXES[encoding]
+    with _compress_locks_guard:
+        lock = _compress_locks.setdefault(target, threading.Lock())
+    with lock:
+        fresh = os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path)
+        if not fresh:
+            _compress(path, target, encoding)
+    with _compress_locks_guard:
+        # Requests still waiting hold the lock object; they find the copy fresh
+        if _compress_locks.get(target) is lock:
+            del _compress_locks[target]
+    if os.path.getsize(target) > os.path.getsize(path) * (1 - MIN_SAVING):
+        return None
+    return target
+
+@dataclass
+class SweepStats:
+    files_removed: int = 0
+    bytes_removed: int = 0
+    bytes_kept: int = 0
+    swept_at: Optional[float] = None
+
+class RetentionSweeper:
+    """Enforces age and size limits on a folder from a daemon thread"""
+
+    def __init__(self, folder: str, max_age_seconds: float, max_bytes: int, interval: float = 300.0):
+        self.folder = folder
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.last_sweep = SweepStats()
+        self._thread: Optional[threading.Thread] = None
+
+    def _groups(self) -> Dict[str, List[str]]:
+        """Each output file together with its compressed copies"""
+        groups: Dict[str, List[str]] = {}
+        for filename in os.listdir(self.folder):
+            base = filename
+            for suffix in ENCODING_SUFFIXES.values():
+                if filename.endswith(suffix):
+                    base = filename[:-len(suffix)]
+            groups.setdefault(base, []).append(os.path.join(self.folder, filename))
+        return groups
+
+    def sweep(self) -> SweepStats:
+        stats = SweepStats(swept_at=time.time())
+        if not os.path.isdir(self.folder):
+            self.last_sweep = stats
+            return stats
+
+        entries = []
+        for base, paths in self._groups().items():
+            try:
+                size = sum(os.path.getsize(path) for path in paths)
+                modified = max(os.path.getmtime(path) for path in paths)
+            except OSError:
+                continue  # removed or being replaced while we looked
+            entries.append((modified, size, paths))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        cutoff = stats.swept_at - self.max_age_seconds
+        for modified, size, paths in entries:
+            if modified >= cutoff and total <= self.max_bytes:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            stats.files_removed += 1
+            stats.bytes_removed += size
+            total -= size
+        stats.bytes_kept = total
+
+        if stats.files_removed:
+            print(f"Retention sweep removed {stats.files_removed} files ({stats.bytes_removed} bytes)")
+        self.last_sweep = stats
+        return stats
+
+    def _run(self):
+        # A daemon thread, so it ends with the process
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Retention sweep failed: {str(e)}")
+
+    def start(self):
+        if self._thread is None:
+            self.sweep()
+            self._thread = threading.Thread(target=self._run, name='retention-sweeper', daemon=True)
+            self._thread.start()
+
+    def describe(self) -> Dict:
+        return {
+            "max_age_hours": round(self.max_age_seconds / 3600, 2),
+            "max_megabytes": round(self.max_bytes / 2 ** 20, 1),
+            "interval_seconds": self.interval,
+            "last_sweep": asdict(self.last_sweep)
+        }
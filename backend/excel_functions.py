@@ -0,0 +1,255 @@
+"""Excel-style functions that evaluate over whole columns.
+
+Dates are handled as Excel serial day numbers (days since 1899-12-30) so they
+live in the same float64 columns as every other variable; datetime64 arrays
+are accepted wherever a date is expected.
+"""
+from functools import reduce
+from typing import Dict, Any
+
+import numpy as np
+import pandas as pd
+
+from factor_tables import FACTOR_TABLES
+
+EXCEL_EPOCH = np.datetime64('1899-12-30', 'D')
+
+def to_serial(values) -> np.ndarray:
+    """Convert datetime64 input to Excel serial days; numbers pass through"""
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        serial = (values.astype('datetime64[D]') - EXCEL_EPOCH).astype(np.float64)
+        serial[np.isnat(values)] = np.nan
+        return serial
+    return values.astype(np.float64)
+
+def serial_to_datetime(serial) -> pd.Series:
+    """Convert Excel serial days back into pandas datetimes"""
+    return pd.to_datetime(np.asarray(serial, dtype=np.float64), unit='D', origin=pd.Timestamp('1899-12-30'))
+
+def _to_days(serial):
+    serial = to_serial(serial)
+    finite = np.isfinite(serial)
+    days = EXCEL_EPOCH + np.where(finite, np.floor(serial), 0).astype('timedelta64[D]')
+    return days, finite
+
+def _split(serial):
+    """Year, month (1-12), day (1-31) and validity of a serial date array"""
+    days, finite = _to_days(serial)
+    months = days.astype('datetime64[M]')
+    year = months.astype('datetime64[Y]').astype(np.int64) + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months.astype('datetime64[D]')).astype(np.int64) + 1
+    return year, month, day, finite
+
+def _from_parts(year, month_index, day):
+    """Serial date from a year, a zero-based month offset and a day, clamping to month end"""
+    months = ((np.asarray(year, dtype=np.int64) - 1970) * 12 + np.asarray(month_index, dtype=np.int64)).astype('datetime64[M]')
+    month_start = months.astype('datetime64[D]')
+    month_length = ((months + 1).astype('datetime64[D]') - month_start).astype(np.int64)
+    day = np.minimum(np.asarray(day, dtype=np.int64), month_length)
+    return (month_start - EXCEL_EPOCH).astype(np.float64) + day - 1
+
+def _days_in_month(year, month):
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    return ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+
+def _is_leap(year):
+    return (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+
+def _invalid(result, finite):
+    result = np.asarray(result, dtype=np.float64)
+    return np.where(finite, result, np.nan)
+
+def edate(start, months):
+    """EDATE(start, months): same day `months` later, clamped to month end"""
+    year, month, day, finite = _split(start)
+    months = np.trunc(np.nan_to_num(np.asarray(months, dtype=np.float64))).astype(np.int64)
+    result = _from_parts(year, month - 1 + months, day)
+    return _invalid(result, finite & np.isfinite(np.asarray(months, dtype=np.float64)))
+
+def eomonth(start, months):
+    """EOMONTH(start, months): last day of the month `months` later"""
+    year, month, _, finite = _split(start)
+    months = np.trunc(np.nan_to_num(np.asarray(months, dtype=np.float64))).astype(np.int64)
+    return _invalid(_from_parts(year, month - 1 + months, 31), finite)
+
+def date(year, month, day):
+    """DATE(year, month, day) with Excel's month and day overflow"""
+    year = np.trunc(np.asarray(year, dtype=np.float64))
+    month = np.trunc(np.asarray(month, dtype=np.float64))
+    day = np.trunc(np.asarray(day, dtype=np.float64))
+    finite = np.isfinite(year) & np.isfinite(month) & np.isfinite(day)
+    first = _from_parts(np.nan_to_num(year), np.nan_to_num(month) - 1, 1)
+    return _invalid(first + np.nan_to_num(day) - 1, finite)
+
+def year(serial):
+    value, _, _, finite = _split(serial)
+    return _invalid(value, finite)
+
+def month(serial):
+    _, value, _, finite = _split(serial)
+    return _invalid(value, finite)
+
+def day(serial):
+    _, _, value, finite = _split(serial)
+    return _invalid(value, finite)
+
+def yearfrac(start, end, basis=0):
+    """YEARFRAC(start, end, [basis]) for Excel bases 0-4; the order of dates does not matter"""
+    start = to_serial(start)
+    end = to_serial(end)
+    start, end = np.minimum(start, end), np.maximum(start, end)
+    y1, m1, d1, finite1 = _split(start)
+    y2, m2, d2, finite2 = _split(end)
+    finite = finite1 & finite2
+    basis = int(basis)
+    days = np.floor(end) - np.floor(start)
+
+    if basis == 0:
+        # US (NASD) 30/360
+        last_feb1 = (m1 == 2) & (d1 == _days_in_month(y1, m1))
+        last_feb2 = (m2 == 2) & (d2 == _days_in_month(y2, m2))
+        d2 = np.where(last_feb1 & last_feb2, 30, d2)
+        d1 = np.where((d1 == 31) | last_feb1, 30, d1)
+        d2 = np.where((d2 == 31) & (d1 >= 30), 30, d2)
+        result = ((y2 - y1) * 360 + (m2 - m1) * 30 + (d2 - d1)) / 360.0
+    elif basis == 1:
+        # Actual/actual: average length of the calendar years spanned
+        same_year = y1 == y2
+        within_year = (y2 == y1 + 1) & ((m1 > m2) | ((m1 == m2) & (d1 >= d2)))
+        feb29_spanned = _spans_feb29(y1, m1, d1, y2, m2, d2)
+        short_denominator = np.where(
+            same_year, np.where(_is_leap(y1), 366.0, 365.0),
+            np.where(feb29_spanned, 366.0, 365.0)
+        )
+        spanned_years = y2 - y1 + 1
+        leap_days = _leap_years_through(y2) - _leap_years_through(y1 - 1)
+        average = (spanned_years * 365.0 + leap_days) / spanned_years
+        result = days / np.where(same_year | within_year, short_denominator, average)
+    elif basis == 2:
+        result = days / 360.0
+    elif basis == 3:
+        result = days / 365.0
+    elif basis == 4:
+        # European 30/360
+        d1 = np.minimum(d1, 30)
+        d2 = np.minimum(d2, 30)
+        result = ((y2 - y1) * 360 + (m2 - m1) * 30 + (d2 - d1)) / 360.0
+    else:
+        raise ValueError(f"YEARFRAC basis must be 0-4, got {basis}")
+    return _invalid(result, finite)
+
+def _leap_years_through(year):
+    return year // 4 - year // 100 + year // 400
+
+def _spans_feb29(y1, m1, d1, y2, m2, d2):
+    start_leap = _is_leap(y1) & ((m1 < 2) | ((m1 == 2) & (d1 <= 29)))
+    end_leap = _is_leap(y2) & ((m2 > 2) | ((m2 == 2) & (d2 == 29)))
+    return start_leap | end_leap
+
+def datedif(start, end, unit):
+    """DATEDIF(start, end, unit) for units Y, M, D, YM, YD and MD"""
+    start = to_serial(start)
+    end = to_serial(end)
+    y1, m1, d1, finite1 = _split(start)
+    y2, m2, d2, finite2 = _split(end)
+    finite = finite1 & finite2 & (np.floor(end) >= np.floor(start))
+    months = (y2 - y1) * 12 + (m2 - m1) - (d2 < d1)
+    unit = str(unit).upper()
+
+    if unit == 'D':
+        result = np.floor(end) - np.floor(start)
+    elif unit == 'M':
+        result = months
+    elif unit == 'Y':
+        result = months // 12
+    elif unit == 'YM':
+        result = months % 12
+    elif unit == 'YD':
+        result = np.floor(end) - _from_parts(y1, m1 - 1 + (months // 12) * 12, d1)
+    elif unit == 'MD':
+        result = np.floor(end) - _from_parts(y1, m1 - 1 + months, d1)
+    else:
+        raise ValueError(f"Unsupported DATEDIF unit '{unit}'")
+    return _invalid(result, finite)
+
+def _scaled(value, digits):
+    # Rounding to 9 decimals first absorbs binary noise such as 1.005 * 100 = 100.49999...
+    factor = np.power(10.0, np.trunc(np.asarray(digits, dtype=np.float64)))
+    value = np.asarray(value, dtype=np.float64)
+    return np.round(np.abs(value) * factor, 9), np.sign(value), factor
+
+def excel_round(value, digits=0):
+    """ROUND: half away from zero, as Excel does"""
+    scaled, sign, factor = _scaled(value, digits)
+    return sign * np.floor(scaled + 0.5) / factor
+
+def roundup(value, digits=0):
+    """ROUNDUP: away from zero"""
+    scaled, sign, factor = _scaled(value, digits)
+    return sign * np.ceil(scaled) / factor
+
+def rounddown(value, digits=0):
+    """ROUNDDOWN: towards zero"""
+    scaled, sign, factor = _scaled(value, digits)
+    return sign * np.floor(scaled) / factor
+
+def excel_if(condition, if_true, if_false=0.0):
+    return np.where(np.asarray(condition, dtype=bool), if_true, if_false)
+
+def excel_max(*args):
+    """MAX across arguments, element by element"""
+    return reduce(np.maximum, (to_serial(arg) for arg in args))
+
+def excel_min(*args):
+    """MIN across arguments, element by element"""
+    return reduce(np.minimum, (to_serial(arg) for arg in args))
+
+# Logical results are 1.0/0.0, not bools: NumPy adds two bool arrays as OR, so AND(a, b) + OR(c, d) would cap at 1
+
+def excel_and(*args):
+    return reduce(np.logical_and, args).astype(np.float64)
+
+def excel_or(*args):
+    return reduce(np.logical_or, args).astype(np.float64)
+
+def excel_not(value):
+    return np.logical_not(value).astype(np.float64)
+
+def excel_int(value):
+    return np.floor(value)
+
+def excel_mod(value, divisor):
+    return np.mod(value, divisor)
+
+def lookup(table, *values):
+    """LOOKUP("TABLE", key, ...): vectorized lookup in a loaded factor table"""
+    return FACTOR_TABLES.lookup(str(table), *values)
+
+EXCEL_FUNCTIONS: Dict[str, Any] = {
+    'yearfrac': yearfrac,
+    'edate': edate,
+    'eomonth': eomonth,
+    'datedif': datedif,
+    'date': date,
+    'year': year,
+    'month': month,
+    'day': day,
+    'round': excel_round,
+    'roundup': roundup,
+    'rounddown': rounddown,
+    'if': excel_if,
+    'max': excel_max,
+    'min': excel_min,
+    'and': excel_and,
+    'or': excel_or,
+    'not': excel_not,
+    'int': excel_int,
+    'mod': excel_mod,
+    'power': np.power,
+    'lookup': lookup
+}
+
+# Functions whose result is a date rather than a number
+DATE_FUNCTIONS = {'edate', 'eomonth', 'date'}
@@ -0,0 +1,237 @@
+"""Factor tables (SV_FACTOR, SSV2_FACTOR, ...) indexed for vectorized lookup.
+
+A table is stored as one sorted axis per key column plus a dense value grid,
+so a lookup for a whole column is a searchsorted per axis and one gather.
+"""
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+from typing import List, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+LOOKUP_METHODS = ('exact', 'step', 'interpolate')
+MAX_GRID_CELLS = 5_000_000
+_TABLE_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+class FactorTableError(ValueError):
+    """Raised when an uploaded factor table cannot be indexed"""
+
+class FactorTable:
+    """A factor indexed by one or more numeric keys"""
+
+    def __init__(self, name: str, key_columns: List[str], axes: List[np.ndarray], grid: np.ndarray,
+                 method: str = 'exact'):
+        if method not in LOOKUP_METHODS:
+            raise FactorTableError(f"Unknown lookup method '{method}'. Use one of: {', '.join(LOOKUP_METHODS)}")
+        if not _TABLE_NAME.match(name):
+            raise FactorTableError(f"Table name '{name}' must be a valid variable name, e.g. SV_FACTOR")
+        self.name = name.upper()
+        self.key_columns = key_columns
+        self.axes = axes
+        self.grid = grid
+        self.method = method
+        digest = hashlib.sha1(self.name.encode('utf-8'))
+        digest.update(method.encode('utf-8'))
+        for axis in axes:
+            digest.update(axis.tobytes())
+        digest.update(grid.tobytes())
+        self.fingerprint = digest.hexdigest()
+
+    @classmethod
+    def from_frame(cls, name: str, df: pd.DataFrame, key_columns: List[str], value_column: Optional[str] = None,
+                   column_key: Optional[str] = None, method: str = 'exact') -> 'FactorTable':
+        """Index a long table (key columns + value column) or a wide one.
+
+        A wide table has a single key column, and every other column header is
+        a value of `column_key` (e.g. rows by policy year, columns by term).
+        """
+        df = df.rename(columns=lambda col: str(col).strip())
+        missing = [col for col in key_columns if col not in df.columns]
+        if missing:
+            raise FactorTableError(f"Key columns not found in table: {', '.join(missing)}")
+
+        if value_column is None:
+            if len(key_columns) != 1 or not column_key:
+                raise FactorTableError("Wide tables need exactly one key column and a column_key")
+            df = df.melt(id_vars=key_columns, var_name=column_key, value_name='__value__')
+            df[column_key] = pd.to_numeric(df[column_key], errors='coerce')
+            key_columns = key_columns + [column_key]
+            value_column = '__value__'
+        elif value_column not in df.columns:
+            raise FactorTableError(f"Value column '{value_column}' not found in table")
+
+        keys = [pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64) for col in key_columns]
+        values = pd.to_numeric(df[value_column], errors='coerce').to_numpy(dtype=np.float64)
+        present = np.isfinite(values)
+        for key in keys:
+            present &= np.isfinite(key)
+        if not present.any():
+            raise FactorTableError("Table has no numeric rows")
+
+        axes = [np.unique(key[present]) for key in keys]
+        shape = tuple(len(axis) for axis in axes)
+        if int(np.prod(shape)) > MAX_GRID_CELLS:
+            raise FactorTableError(f"Table grid {shape} is too large to index")
+        grid = np.full(shape, np.nan)
+        positions = tuple(np.searchsorted(axis, key[present]) for axis, key in zip(axes, keys))
+        grid[positions] = values[present]
+        return cls(name, key_columns, axes, grid, method)
+
+    def lookup(self, *values) -> np.ndarray:
+        """Look up factors for whole key columns; misses come back as NaN"""
+        if len(values) != len(self.axes):
+            raise ValueError(f"{self.name} needs {len(self.axes)} keys, got {len(values)}")
+        keys = np.broadcast_arrays(*[np.asarray(value, dtype=np.float64) for value in values])
+        if self.method == 'interpolate':
+            return self._interpolate(keys)
+
+        positions = []
+        found = np.ones(keys[0].shape, dtype=bool)
+        for axis, key in zip(self.axes, keys):
+            if self.method == 'step':
+                position = np.searchsorted(axis, key, side='right') - 1
+                # searchsorted puts NaN after every band; a NaN key is a miss
+                found &= (position >= 0) & ~np.isnan(key)
+            else:
+                position = np.searchsorted(axis, key)
+                found &= (position < len(axis)) & (axis[np.clip(position, 0, len(axis) - 1)] == key)
+            positions.append(np.clip(position, 0, len(axis) - 1))
+        return np.where(found, self.grid[tuple(positions)], np.nan)
+
+    def _interpolate(self, keys) -> np.ndarray:
+        lower = []
+        weights = []
+        inside = np.ones(keys[0].shape, dtype=bool)
+        for axis, key in zip(self.axes, keys):
+            inside &= (key >= axis[0]) & (key <= axis[-1])
+            if len(axis) == 1:
+                lower.append(np.zeros(key.shape, dtype=np.intp))
+                weights.append(np.zeros(key.shape))
+                continue
+            position = np.clip(np.searchsorted(axis, key, side='right') - 1, 0, len(axis) - 2)
+            span = axis[position + 1] - axis[position]
+            lower.append(position)
+            weights.append((key - axis[position]) / span)
+
+        result = np.zeros(keys[0].shape)
+        for corner in itertools.product((0, 1), repeat=len(self.axes)):
+            weight = np.ones(keys[0].shape)
+            index = []
+            for offset, position, fraction, axis in zip(corner, lower, weights, self.axes):
+                weight = weight * (fraction if offset else 1.0 - fraction)
+                index.append(np.minimum(position + offset, len(axis) - 1))
+            # Corners with no weight must not turn a valid result into NaN
+            result += np.where(weight > 0, weight * self.grid[tuple(index)], 0.0)
+        return np.where(inside, result, np.nan)
+
+    def to_dict(self) -> Dict:
+        """JSON form used to send a table to another service; empty cells become null"""
+        return {
+            "name": self.name,
+            "key_columns": self.key_columns,
+            "axes": [axis.tolist() for axis in self.axes],
+            "grid": np.where(np.isfinite(self.grid), self.grid, None).tolist(),
+            "method": self.method
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'FactorTable':
+        try:
+            axes = [np.asarray(axis, dtype=np.float64) for axis in data['axes']]
+            grid = np.asarray(data['grid'], dtype=np.float64)
+            key_columns = list(data['key_columns'])
+            name = data['name']
+        except (KeyError, TypeError, ValueError) as e:
+            raise FactorTableError(f"Invalid factor table data: {str(e)}")
+        if grid.shape != tuple(len(axis) for axis in axes) or len(key_columns) != len(axes):
+            raise FactorTableError("Factor table grid does not match its axes")
+        return cls(name, key_columns, axes, grid, data.get('method', 'exact'))
+
+    def describe(self) -> Dict:
+        return {
+            "name": self.name,
+            "key_columns": self.key_columns,
+            "method": self.method,
+            "shape": list(self.grid.shape),
+            "filled_cells": int(np.isfinite(self.grid).sum()),
+            "fingerprint": self.fingerprint
+        }
+
+class FactorTableRegistry:
+    """Factor tables shared by every /process-data run, optionally persisted to disk"""
+
+    def __init__(self, folder: Optional[str] = None):
+        self.folder = folder
+        self._tables: Dict[str, FactorTable] = {}
+        self._lock = threading.Lock()
+
+    def add(self, table: FactorTable):
+        with self._lock:
+            self._tables[table.name] = table
+        if self.folder:
+            self._save(table)
+
+    def remove(self, name: str) -> bool:
+        name = name.upper()
+        with self._lock:
+            removed = self._tables.pop(name, None) is not None
+        if removed and self.folder:
+            for ext in ('.npz', '.json'):
+                path = os.path.join(self.folder, name + ext)
+                if os.path.exists(path):
+                    os.remove(path)
+        return removed
+
+    def get(self, name: str) -> Optional[FactorTable]:
+        return self._tables.get(str(name).upper())
+
+    def lookup(self, name: str, *values) -> np.ndarray:
+        table = self.get(name)
+        if table is None:
+            raise KeyError(f"Factor table '{str(name).upper()}' is not loaded")
+        return table.lookup(*values)
+
+    def names(self) -> List[str]:
+        return list(self._tables)
+
+    def __contains__(self, name: str) -> bool:
+        return str(name).upper() in self._tables
+
+    def __len__(self):
+        return len(self._tables)
+
+    def describe(self) -> List[Dict]:
+        return [table.describe() for table in self._tables.values()]
+
+    def _save(self, table: FactorTable):
+        os.makedirs(self.folder, exist_ok=True)
+        np.savez(os.path.join(self.folder, table.name + '.npz'), *table.axes, grid=table.grid)
+        with open(os.path.join(self.folder, table.name + '.json'), 'w') as f:
+            json.dump({"key_columns": table.key_columns, "method": table.method}, f)
+
+    def load(self):
+        """Reload tables persisted by earlier runs"""
+        if not self.folder or not os.path.isdir(self.folder):
+            return
+        for filename in os.listdir(self.folder):
+            if not filename.endswith('.json'):
+                continue
+            name = filename[:-5]
+            try:
+                with open(os.path.join(self.folder, filename)) as f:
+                    meta = json.load(f)
+                with np.load(os.path.join(self.folder, name + '.npz')) as data:
+                    axes = [data[f'arr_{i}'] for i in range(len(meta['key_columns']))]
+                    grid = data['grid']
+                with self._lock:
+                    self._tables[name] = FactorTable(name, meta['key_columns'], axes, grid, meta['method'])
+            except Exception as e:
+                print(f"Error loading factor table {name}: {str(e)}")
+
+# Tables available to formulas by bare name (SV_FACTOR) or through LOOKUP("SV_FACTOR", ...)
+FACTOR_TABLES = FactorTableRegistry()
@@ -0,0 +1,171 @@
+"""Evaluation backends for compiled formulas.
+
+The NumPy path in formula_engine evaluates an expression one operation at a
+time, allocating a full-size temporary for every intermediate result. When
+numexpr is installed, the common subset of formulas (arithmetic, comparisons,
+abs/sqrt/exp/log/trig, MAX/MIN, IF, AND/OR/NOT, INT, MOD, POWER) is lowered
+to a numexpr expression instead, which is evaluated in cache-sized blocks on
+several threads without those temporaries. Anything outside that subset
+(dates, rounding, LOOKUP, ...) still runs on NumPy, so both paths give the
+same results.
+"""
+import ast
+import os
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+BACKENDS = ('auto', 'numexpr', 'numpy')
+
+class UnsupportedExpression(Exception):
+    """Raised while lowering an expression the backend cannot evaluate"""
+
+_BINARY_OPS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.Pow: '**'}
+_COMPARE_OPS = {ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>='}
+_UNARY_FUNCTIONS = {'abs', 'sqrt', 'exp', 'sin', 'cos', 'tan'}
+_LOGICAL_FUNCTIONS = {'and', 'or', 'not'}
+
+class _NumexprLowering:
+    """Translate a validated formula AST into numexpr source.
+
+    Variables become positional arguments (v0, v1, ...) so column names can
+    never clash with numexpr's own function names. numexpr does not mix
+    booleans and floats, so every subexpression is lowered either as a
+    condition or as a value, converting between the two explicitly with the
+    same truthiness the NumPy functions use (non-zero and NaN are true).
+    """
+
+    def __init__(self, names: Dict[str, str], constants: Dict[str, float]):
+        self.names = names
+        self.constants = constants
+        self.arguments: List[str] = []
+
+    def _variable(self, key: str) -> str:
+        if key not in self.arguments:
+            self.arguments.append(key)
+        return f"v{self.arguments.index(key)}"
+
+    def _is_condition(self, node) -> bool:
+        return isinstance(node, ast.Compare) or (
+            isinstance(node, ast.Call) and node.func.id.lower() in _LOGICAL_FUNCTIONS
+        )
+
+    def condition(self, node) -> str:
+        if isinstance(node, ast.Compare):
+            parts = []
+            left = self.value(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                if type(op) not in _COMPARE_OPS:
+                    raise UnsupportedExpression(type(op).__name__)
+                right = self.value(comparator)
+                parts.append(f"({left} {_COMPARE_OPS[type(op)]} {right})")
+                left = right
+            return parts[0] if len(parts) == 1 else f"({' & '.join(parts)})"
+        if isinstance(node, ast.Call) and node.func.id.lower() in _LOGICAL_FUNCTIONS:
+            func = node.func.id.lower()
+            args = [self.condition(arg) for arg in node.args]
+            if func == 'not':
+                if len(args) != 1:
+                    raise UnsupportedExpression('not')
+                return f"(~{args[0]})"
+            if not args:
+                raise UnsupportedExpression(func)
+            return f"({(' & ' if func == 'and' else ' | ').join(args)})"
+        return f"({self.value(node)} != 0.0)"
+
+    def value(self, node) -> str:
+        if self._is_condition(node):
+            return f"where({self.condition(node)}, 1.0, 0.0)"
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise UnsupportedExpression(repr(node.value))
+            return repr(float(node.value))
+        if isinstance(node, ast.Name):
+            key = self.names[node.id]
+            if key in self.constants:
+                return repr(float(self.constants[key]))
+            return self._variable(key)
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.USub):
+                return f"(-{self.value(node.operand)})"
+            if isinstance(node.op, ast.UAdd):
+                return self.value(node.operand)
+            raise UnsupportedExpression(type(node.op).__name__)
+        if isinstance(node, ast.BinOp):
+            left, right = self.value(node.left), self.value(node.right)
+            if type(node.op) in _BINARY_OPS:
+                return f"({left} {_BINARY_OPS[type(node.op)]} {right})"
+            if isinstance(node.op, ast.Mod):
+                return self._mod(left, right)
+            if isinstance(node.op, ast.FloorDiv):
+                return f"floor({left} / {right})"
+            raise UnsupportedExpression(type(node.op).__name__)
+        if isinstance(node, ast.IfExp):
+            return f"where({self.condition(node.test)}, {self.value(node.body)}, {self.value(node.orelse)})"
+        if isinstance(node, ast.Call):
+            return self._call(node.func.id.lower(), node.args)
+        raise UnsupportedExpression(type(node).__name__)
+
+    def _mod(self, left: str, right: str) -> str:
+        # numpy's % follows the sign of the divisor, C's fmod does not
+        return f"({left} - floor({left} / {right}) * {right})"
+
+    def _call(self, func: str, args) -> str:
+        if func in _UNARY_FUNCTIONS and len(args) == 1:
+            return f"{func}({self.value(args[0])})"
+        if func == 'log' and len(args) in (1, 2):
+            if len(args) == 1:
+                return f"log({self.value(args[0])})"
+            return f"(log({self.value(args[0])}) / log({self.value(args[1])}))"
+        if func in ('max', 'min') and args:
+            values = [self.value(arg) for arg in args]
+            result = values[0]
+            op = '>=' if func == 'max' else '<='
+            for other in values[1:]:
+                # np.maximum / np.minimum propagate NaN from either side
+                result = f"where(({result} {op} {other}) | ({result} != {result}), {result}, {other})"
+            return result
+        if func == 'if' and len(args) in (2, 3):
+            if_false = self.value(args[2]) if len(args) == 3 else '0.0'
+            return f"where({self.condition(args[0])}, {self.value(args[1])}, {if_false})"
+        if func == 'power' and len(args) == 2:
+            return f"({self.value(args[0])} ** {self.value(args[1])})"
+        if func == 'int' and len(args) == 1:
+            return f"floor({self.value(args[0])})"
+        if func == 'mod' and len(args) == 2:
+            return self._mod(self.value(args[0]), self.value(args[1]))
+        raise UnsupportedExpression(func)
+
+class NumexprBackend:
+    """Evaluates lowered formulas with numexpr (multi-threaded, blocked, no temporaries)"""
+    name = 'numexpr'
+
+    def lower(self, compiled, constants: Dict[str, float]) -> Optional[Tuple[str, List[str]]]:
+        """numexpr source and argument keys for a formula, or None if it must run on NumPy"""
+        lowering = _NumexprLowering(compiled.names, constants)
+        try:
+            source = lowering.value(compiled.tree.body)
+        except UnsupportedExpression:
+            return None
+        return source, lowering.arguments
+
+    def evaluate(self, kernel: Tuple[str, List[str]], resolve):
+        source, arguments = kernel
+        local_dict = {f"v{position}": resolve(key) for position, key in enumerate(arguments)}
+        return ne.evaluate(source, local_dict=local_dict, global_dict={})
+
+def select_backend(name: Optional[str] = None) -> Optional[NumexprBackend]:
+    """The backend named by `name` or FORMULA_BACKEND; None means plain NumPy"""
+    name = (name or os.getenv('FORMULA_BACKEND', 'auto')).strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown formula backend '{name}'. Use one of: {', '.join(BACKENDS)}")
+    if name == 'numpy':
+        return None
+    if ne is None:
+        if name == 'numexpr':
+            print("numexpr not installed. Install with: pip install numexpr")
+        return None
+    return NumexprBackend()
@@ -0,0 +1,642 @@
+import ast
+import copy
+import math
+import re
+import warnings
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from excel_functions import DATE_FUNCTIONS, EXCEL_EPOCH, EXCEL_FUNCTIONS
+from formula_backends import select_backend
+from factor_tables import FACTOR_TABLES
+
+def clean_column_name(name: str) -> str:
+    """Clean column name for consistent matching"""
+    return str(name).strip().lower().replace(' ', '_').replace('%', 'percent').replace('*', '')
+
+def normalize_expression(expr: str) -> str:
+    """Convert common mathematical and Excel notation into Python syntax"""
+    expr = str(expr).strip()
+    expr = expr.replace('^', '**')  # Convert ^ to ** for power
+    expr = expr.replace('×', '*')   # Convert × to *
+    expr = expr.replace('÷', '/')   # Convert ÷ to /
+    expr = expr.replace('<>', '!=')  # Excel not-equal
+    # Formulas are often written as an assignment, "GSV = PREMIUM * 0.3" or "=PREMIUM * 0.3"
+    assignment = _ASSIGNMENT.match(expr)
+    if assignment:
+        expr = expr[assignment.end():].strip()
+    return _rewrite_comparisons(expr)
+
+_ASSIGNMENT = re.compile(r'^\s*(?:[A-Za-z_][A-Za-z0-9_]*\s*)?=(?!=)')
+
+def _rewrite_comparisons(expr: str) -> str:
+    """Excel's single = compares; it is rewritten to == inside brackets (IF conditions, arguments).
+
+    A single = left at the top level is a syntax error, not a comparison.
+    """
+    out = []
+    depth = 0
+    quote = None
+    for pos, ch in enumerate(expr):
+        if quote:
+            quote = None if ch == quote else quote
+        elif ch in '\'"':
+            quote = ch
+        elif ch in '([':
+            depth += 1
+        elif ch in ')]':
+            depth = max(depth - 1, 0)
+        elif (ch == '=' and depth > 0 and (pos == 0 or expr[pos - 1] not in '<>!=')
+              and (pos + 1 == len(expr) or expr[pos + 1] != '=')):
+            out.append('==')
+            continue
+        out.append(ch)
+    return ''.join(out)
+
+def _abs(x):
+    return np.abs(x)
+
+def _log(x, base=None):
+    if base is None:
+        return np.log(x)
+    return np.log(x) / np.log(base)
+
+# Functions available to formulas, bound once and applied to whole columns.
+# Names are case-insensitive, so Excel's ROUND and Python's round are one function.
+FORMULA_FUNCTIONS: Dict[str, Any] = {
+    'abs': _abs,
+    'sqrt': np.sqrt,
+    'exp': np.exp,
+    'log': _log,
+    'sin': np.sin,
+    'cos': np.cos,
+    'tan': np.tan,
+    **EXCEL_FUNCTIONS
+}
+
+FORMULA_CONSTANTS: Dict[str, float] = {
+    'pi': math.pi,
+    'e': math.e,
+    'true': 1.0,
+    'false': 0.0
+}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+    ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.operator, ast.unaryop, ast.boolop, ast.cmpop
+)
+
+class FormulaCompileError(ValueError):
+    """Raised when an expression is not a valid formula"""
+
+@dataclass
+class CompiledFormula:
+    """An expression parsed and compiled once, ready for column evaluation"""
+    expression: str
+    code: Any
+    tree: ast.Expression
+    # identifier as written in the expression -> cleaned lookup key
+    names: Dict[str, str]
+    # identifiers used in call position
+    called: Set[str]
+    dependencies: Set[str] = field(default_factory=set)
+    functions: Set[str] = field(default_factory=set)
+    # backend name -> lowered kernel, or None when the formula runs on NumPy
+    kernels: Dict[str, Any] = field(default_factory=dict)
+    # variables read as LOOKUP() keys; the code reads them as LOOKUP_KEY_PREFIX + key, NaN where invalid
+    lookup_keys: Set[str] = field(default_factory=set)
+
+    def returns_date(self, date_columns: Set[str]) -> bool:
+        return _returns_date(self.tree, date_columns)
+
+LOOKUP_KEY_PREFIX = '__key_'
+
+class _CodeRewriter(ast.NodeTransformer):
+    """Rewrites the tree that is compiled to code.
+
+    Every comparison evaluates to 1.0/0.0 instead of a bool: NumPy adds bool
+    arrays as a logical OR, so (a > 0) + (b > 0) would be 1 where Excel, the
+    per-row evaluator and numexpr all give 2. Variables inside LOOKUP() key
+    arguments are read through their masked name, so a blank key is a miss
+    rather than key 0.
+    """
+
+    def __init__(self, dependencies: Set[str]):
+        self.dependencies = dependencies
+        self.lookup_keys: Set[str] = set()
+        self._in_key = 0
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        return ast.BinOp(left=node, op=ast.Add(), right=ast.Constant(0.0))
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id.lower() != 'lookup':
+            return self.generic_visit(node)
+        node.args[:1] = [self.visit(arg) for arg in node.args[:1]]
+        self._in_key += 1
+        node.args[1:] = [self.visit(arg) for arg in node.args[1:]]
+        self._in_key -= 1
+        return node
+
+    def visit_Name(self, node):
+        key = node.id.lower()
+        if self._in_key and key in self.dependencies:
+            self.lookup_keys.add(key)
+            return ast.Name(id=LOOKUP_KEY_PREFIX + key, ctx=node.ctx)
+        return node
+
+def _rewrite_for_code(tree: ast.Expression, dependencies: Set[str]):
+    """A rewritten copy for the compiled code, and the LOOKUP() key variables.
+
+    `tree` itself stays as written for analysis and lowering.
+    """
+    rewriter = _CodeRewriter(dependencies)
+    code_tree = ast.fix_missing_locations(rewriter.visit(copy.deepcopy(tree)))
+    return code_tree, rewriter.lookup_keys
+
+@lru_cache(maxsize=1024)
+def compile_formula(expr: str, output: Optional[str] = None) -> CompiledFormula:
+    """Parse, validate and compile an expression.
+
+    Variables are matched case-insensitively against cleaned column names,
+    the same way the per-row evaluator used to lowercase them. With `output`
+    (the formula's cleaned output column), "GSV == ..." is rejected: it is an
+    assignment written as a comparison and would evaluate to 0/1.
+    """
+    source = normalize_expression(expr)
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError as e:
+        raise FormulaCompileError(f"Invalid expression '{expr}': {e.msg}")
+    body = tree.body
+    if (output and isinstance(body, ast.Compare) and len(body.ops) == 1 and isinstance(body.ops[0], ast.Eq)
+            and isinstance(body.left, ast.Name) and clean_column_name(body.left.id) == output):
+        raise FormulaCompileError(f"'{expr}' compares the output {body.left.id} instead of defining it")
+
+    called = {node.func.id for node in ast.walk(tree) if isinstance(node, ast.Call) and isinstance(node.func, ast.Name)}
+    names = {}
+    dependencies = set()
+    functions = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise FormulaCompileError(f"Unsupported syntax in '{expr}': {type(node).__name__}")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id.lower() not in FORMULA_FUNCTIONS:
+                raise FormulaCompileError(f"Unsupported function call in '{expr}'")
+            if node.keywords:
+                raise FormulaCompileError(f"Keyword arguments are not supported in '{expr}'")
+        if isinstance(node, ast.Name):
+            key = node.id.lower()
+            names[node.id] = key
+            # A name is a function only where it is called, so a YEAR column stays a variable
+            if node.id in called:
+                functions.add(key)
+            elif key not in FORMULA_CONSTANTS:
+                dependencies.add(key)
+
+    code_tree, lookup_keys = _rewrite_for_code(tree, dependencies)
+    code = compile(code_tree, '<formula>', 'eval')
+    return CompiledFormula(
+        expression=expr,
+        code=code,
+        tree=tree,
+        names=names,
+        called=called,
+        dependencies=dependencies,
+        functions=functions,
+        lookup_keys=lookup_keys
+    )
+
+# numexpr when installed (FORMULA_BACKEND=auto|numexpr|numpy), otherwise plain NumPy
+FORMULA_BACKEND = select_backend()
+
+def formula_backend_name() -> str:
+    return FORMULA_BACKEND.name if FORMULA_BACKEND is not None else 'numpy'
+
+def _kernel(compiled: CompiledFormula):
+    backend = FORMULA_BACKEND
+    if backend is None:
+        return None, None
+    if backend.name not in compiled.kernels:
+        compiled.kernels[backend.name] = backend.lower(compiled, FORMULA_CONSTANTS)
+    return backend, compiled.kernels[backend.name]
+
+def _returns_date(node, date_columns: Set[str]) -> bool:
+    """Infer whether an expression yields a date (serial days) rather than a number"""
+    if isinstance(node, ast.Expression):
+        return _returns_date(node.body, date_columns)
+    if isinstance(node, ast.Name):
+        return node.id.lower() in date_columns
+    if isinstance(node, ast.Call):
+        func = node.func.id.lower()
+        if func in DATE_FUNCTIONS:
+            return True
+        if func == 'if':
+            return any(_returns_date(arg, date_columns) for arg in node.args[1:])
+        if func in ('max', 'min'):
+            return any(_returns_date(arg, date_columns) for arg in node.args)
+        return False
+    if isinstance(node, ast.IfExp):
+        return _returns_date(node.body, date_columns) or _returns_date(node.orelse, date_columns)
+    if isinstance(node, ast.BinOp):
+        left = _returns_date(node.left, date_columns)
+        right = _returns_date(node.right, date_columns)
+        if isinstance(node.op, ast.Add):
+            return left != right
+        if isinstance(node.op, ast.Sub):
+            return left and not right
+    return False
+
+class ColumnStore:
+    """Contiguous float64 columns with validity masks.
+
+    Only the variables the formulas read are stored. Missing or non-numeric
+    values are stored as 0.0 and flagged in the validity mask, which keeps
+    the old "missing -> 0.0" semantics without a per-row dictionary. Date
+    columns are stored as Excel serial days and listed in `date_columns`;
+    a missing date stays NaN, since serial 0.0 would be a real date
+    (1899-12-30) and every date function would return a result for it.
+    """
+
+    def __init__(self, n_rows: int):
+        self.n_rows = n_rows
+        self.values: Dict[str, np.ndarray] = {}
+        self.valid: Dict[str, np.ndarray] = {}
+        self.date_columns: Set[str] = set()
+        # columns filled from factor tables rather than the upload
+        self.lookup_columns: Set[str] = set()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, names: Set[str], aliases: Optional[Dict[str, str]] = None) -> 'ColumnStore':
+        """Load the columns named in `names`; `aliases` maps other names to the column holding them"""
+        store = cls(len(df))
+        for col in df.columns:
+            key = clean_column_name(col)
+            if key in names:
+                store.add_series(key, df[col])
+        for key, col in (aliases or {}).items():
+            if key in names and key not in store:
+                store.add_series(key, df[col])
+        return store
+
+    def add_series(self, key: str, series: pd.Series):
+        dates = _as_dates(series)
+        if dates is not None:
+            values = ((dates - pd.Timestamp(EXCEL_EPOCH)) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+            self.date_columns.add(key)
+        else:
+            values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+            self.date_columns.discard(key)
+        valid = np.isfinite(values)
+        values[~valid] = np.nan if dates is not None else 0.0
+        self.values[key] = values
+        self.valid[key] = valid
+
+    def reserve(self, key: str, is_date: bool = False):
+        """Make sure a formula output column exists before results are written into it"""
+        if key not in self.values:
+            self.values[key] = np.full(self.n_rows, np.nan) if is_date else np.zeros(self.n_rows, dtype=np.float64)
+            self.valid[key] = np.zeros(self.n_rows, dtype=bool)
+        if is_date:
+            self.date_columns.add(key)
+
+    def update_range(self, key: str, start: int, stop: int, values: np.ndarray, ok: np.ndarray):
+        """Overwrite rows start:stop where a formula succeeded, keeping prior values elsewhere"""
+        np.copyto(self.values[key][start:stop], values, where=ok)
+        self.valid[key][start:stop] |= ok
+
+    def reserve_lookup(self, key: str):
+        if key not in self.values:
+            self.values[key] = np.full(self.n_rows, np.nan)
+            self.valid[key] = np.zeros(self.n_rows, dtype=bool)
+        self.lookup_columns.add(key)
+
+    def add_lookup(self, key: str, table, start: int = 0, stop: Optional[int] = None):
+        """Fill rows start:stop of a column from a factor table using the table's key columns.
+
+        Lookup misses stay NaN so formulas using them fail visibly instead of
+        treating a missing factor as 0.
+        """
+        stop = self.n_rows if stop is None else stop
+        self.reserve_lookup(key)
+        keys = []
+        keys_valid = np.ones(stop - start, dtype=bool)
+        for col in table.key_columns:
+            key_column = clean_column_name(col)
+            if key_column in self.values:
+                keys.append(self.values[key_column][start:stop])
+                keys_valid &= self.valid[key_column][start:stop]
+            else:
+                keys.append(np.full(stop - start, np.nan))
+                keys_valid[:] = False
+        # A blank key is a miss, not key 0 (and NaN would find the last band of a step table)
+        values = np.where(keys_valid, table.lookup(*keys), np.nan)
+        self.values[key][start:stop] = values
+        self.valid[key][start:stop] = np.isfinite(values)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.values
+
+def _as_dates(series: pd.Series) -> Optional[pd.Series]:
+    """Return the column as datetimes if it holds dates, else None"""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series.dt.tz_localize(None) if getattr(series.dt, 'tz', None) is not None else series
+    if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        return None
+    present = series.dropna()
+    if present.empty or pd.to_numeric(present, errors='coerce').notna().any():
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        dates = pd.to_datetime(series, errors='coerce')
+    return dates if dates.notna().any() else None
+
+def _bind_names(compiled: CompiledFormula, resolve_variable, resolve_key) -> Dict[str, Any]:
+    namespace = {}
+    for name, key in compiled.names.items():
+        if name in compiled.called:
+            namespace[name] = FORMULA_FUNCTIONS[key]
+        elif key in FORMULA_CONSTANTS:
+            namespace[name] = FORMULA_CONSTANTS[key]
+        else:
+            namespace[name] = resolve_variable(key)
+    for key in compiled.lookup_keys:
+        namespace[LOOKUP_KEY_PREFIX + key] = resolve_key(key)
+    return namespace
+
+def _as_result_array(result, size: int) -> np.ndarray:
+    values = np.asarray(result, dtype=np.float64)
+    if values.shape != (size,):
+        values = np.broadcast_to(values, (size,)).copy()
+    return values
+
+def _evaluate_rows_scalar(compiled: CompiledFormula, store: ColumnStore, rows: np.ndarray):
+    """Row-by-row evaluation for expressions numpy cannot broadcast (e.g. `a if a > b else b`)"""
+    values = np.zeros(len(rows), dtype=np.float64)
+    ok = np.zeros(len(rows), dtype=bool)
+    namespace = _bind_names(compiled, lambda key: 0.0, lambda key: math.nan)
+    columns = {name: store.values[key] for name, key in compiled.names.items() if key in compiled.dependencies and key in store}
+    key_columns = {key: (store.values[key], store.valid[key]) for key in compiled.lookup_keys if key in store}
+
+    with np.errstate(all='ignore'):
+        for pos, row in enumerate(rows):
+            for name, column in columns.items():
+                namespace[name] = float(column[row])
+            for key, (column, valid) in key_columns.items():
+                namespace[LOOKUP_KEY_PREFIX + key] = float(column[row]) if valid[row] else math.nan
+            try:
+                result = eval(compiled.code, {"__builtins__": {}}, namespace)
+                if np.ndim(result) != 0 or isinstance(result, str):
+                    continue
+                result = float(result)
+            except Exception:
+                continue
+            if not (math.isnan(result) or math.isinf(result)):
+                values[pos] = result
+                ok[pos] = True
+    return values, ok
+
+def evaluate_compiled(compiled: CompiledFormula, store: ColumnStore, rows: Optional[np.ndarray] = None):
+    """Evaluate a compiled formula over the given rows (all rows when None).
+
+    Returns (values, ok) arrays aligned with `rows`; `ok` is False where the
+    result is missing, NaN or infinite.
+    """
+    if rows is None:
+        rows = np.arange(store.n_rows)
+    full = len(rows) == store.n_rows
+
+    def resolve(key):
+        if key not in store:
+            return 0.0
+        return store.values[key] if full else store.values[key][rows]
+
+    def resolve_key(key):
+        if key not in store:
+            return np.nan
+        values, valid = store.values[key], store.valid[key]
+        if not full:
+            values, valid = values[rows], valid[rows]
+        return np.where(valid, values, np.nan)
+
+    backend, kernel = _kernel(compiled)
+    if kernel is not None:
+        try:
+            values = _as_result_array(backend.evaluate(kernel, resolve), len(rows))
+            return values, np.isfinite(values)
+        except Exception as e:
+            # Only this call falls back: the compiled formula is shared, and the next upload may be fine
+            print(f"{backend.name} could not evaluate '{compiled.expression}', using NumPy: {str(e)}")
+
+    namespace = _bind_names(compiled, resolve, resolve_key)
+    try:
+        with np.errstate(all='ignore'):
+            result = eval(compiled.code, {"__builtins__": {}}, namespace)
+        values = _as_result_array(result, len(rows))
+    except Exception:
+        return _evaluate_rows_scalar(compiled, store, rows)
+
+    ok = np.isfinite(values)
+    return values, ok
+
+def expression_for_variant(formula: Dict, variant: str) -> str:
+    """Pick the variant-specific expression of a formula, or its default one"""
+    variants = formula.get('variants', {})
+    if variants and variant in variants:
+        return variants[variant]
+    return formula.get('mathematical_relationship', '')
+
+def formula_dependencies(formulas: List[Dict], variant_names: List[str]) -> Set[str]:
+    """Union of variables read by every expression that can be evaluated"""
+    dependencies = set()
+    for formula in formulas:
+        for variant in variant_names:
+            expr = expression_for_variant(formula, variant)
+            if not expr:
+                continue
+            try:
+                dependencies |= compile_formula(expr).dependencies
+            except FormulaCompileError:
+                continue
+    # Factor tables referenced by name need their key columns loaded
+    for name in list(dependencies):
+        table = FACTOR_TABLES.get(name)
+        if table is not None:
+            dependencies |= {clean_column_name(col) for col in table.key_columns}
+    return dependencies
+
+def referenced_tables(compiled: CompiledFormula, store: ColumnStore) -> Dict[str, Any]:
+    """Factor tables a formula reads, by bare name or through LOOKUP("NAME", ...)"""
+    tables = {}
+    for dep in compiled.dependencies:
+        if (dep not in store or dep in store.lookup_columns) and dep in FACTOR_TABLES:
+            tables[dep] = FACTOR_TABLES.get(dep)
+    for node in ast.walk(compiled.tree):
+        if (isinstance(node, ast.Call) and node.func.id.lower() == 'lookup' and node.args
+                and isinstance(node.args[0], ast.Constant) and str(node.args[0].value) in FACTOR_TABLES):
+            tables.setdefault(str(node.args[0].value).lower(), FACTOR_TABLES.get(str(node.args[0].value)))
+    return tables
+
+@dataclass
+class FormulaOutcome:
+    """Result of one formula across the whole table"""
+    index: int
+    term: str
+    column: str
+    values: np.ndarray
+    ok: np.ndarray
+    attempted: np.ndarray
+    is_date: bool = False
+    missing_variables: Set[str] = field(default_factory=set)
+
+    @property
+    def failed(self) -> np.ndarray:
+        return self.attempted & ~self.ok
+
+class EvaluationCancelled(Exception):
+    """Raised between chunks when the caller cancels a run"""
+
+@dataclass
+class _FormulaPlan:
+    outcome: FormulaOutcome
+    # (compiled expression, sorted row indices using it)
+    groups: List[Any]
+    # factor tables materialized as columns: name -> table
+    lookups: Dict[str, Any]
+    table_fingerprints: List[str]
+    reuse: Any = None
+
+DEFAULT_CHUNK_SIZE = 50000
+
+def _plan_formulas(store: ColumnStore, formulas: List[Dict], row_variants: np.ndarray, tracker=None) -> List[_FormulaPlan]:
+    """Compile every formula and resolve its rows, tables and reusable results up front"""
+    variant_rows = {
+        variant: np.flatnonzero(row_variants == variant)
+        for variant in pd.unique(row_variants[pd.notna(row_variants)])
+    }
+
+    plans = []
+    for formula_idx, formula in enumerate(formulas):
+        term = formula.get('term_description', '').strip()
+        column = clean_column_name(term)
+        outcome = FormulaOutcome(
+            index=formula_idx,
+            term=term,
+            column=column,
+            values=np.zeros(store.n_rows, dtype=np.float64),
+            ok=np.zeros(store.n_rows, dtype=bool),
+            attempted=np.zeros(store.n_rows, dtype=bool)
+        )
+
+        # Rows of variants that share an expression are evaluated together
+        groups: Dict[str, List[np.ndarray]] = {}
+        for variant, rows in variant_rows.items():
+            expr = expression_for_variant(formula, variant)
+            if expr:
+                groups.setdefault(expr, []).append(rows)
+
+        compiled_groups = []
+        dependencies = set()
+        tables = {}
+        for expr, row_sets in groups.items():
+            rows = np.sort(np.concatenate(row_sets)) if len(row_sets) > 1 else row_sets[0]
+            outcome.attempted[rows] = True
+            try:
+                compiled = compile_formula(expr, column)
+            except FormulaCompileError as e:
+                print(f"Error evaluating expression '{expr}': {str(e)}")
+                continue
+            dependencies |= compiled.dependencies
+            tables.update(referenced_tables(compiled, store))
+            outcome.is_date = outcome.is_date or compiled.returns_date(store.date_columns)
+            compiled_groups.append((compiled, rows))
+
+        # Factor columns are looked up chunk by chunk, from the current key columns
+        lookups = {}
+        table_fingerprints = []
+        for name, table in sorted(tables.items()):
+            table_fingerprints.append(table.fingerprint)
+            if name in dependencies:
+                lookups[name] = table
+                store.reserve_lookup(name)
+                dependencies.discard(name)
+                dependencies |= {clean_column_name(col) for col in table.key_columns}
+
+        for compiled, _ in compiled_groups:
+            outcome.missing_variables |= {dep for dep in compiled.dependencies if dep not in store}
+        for var_name in sorted(outcome.missing_variables):
+            print(f"Warning: Variable '{var_name}' not found in context")
+
+        reuse = None
+        if tracker is not None:
+            reuse = tracker.start_formula(formula_idx, formula, column, dependencies, salt=table_fingerprints)
+            np.copyto(outcome.values, reuse.values, where=reuse.hit)
+            np.copyto(outcome.ok, reuse.ok, where=reuse.hit)
+
+        # Later formulas read this column; rows where it fails keep their prior value (or 0.0)
+        store.reserve(column, is_date=outcome.is_date)
+        plans.append(_FormulaPlan(outcome, compiled_groups, lookups, table_fingerprints, reuse))
+    return plans
+
+def evaluate_formula_set(store: ColumnStore, formulas: List[Dict], row_variants: np.ndarray,
+                         tracker=None, memo=None, progress=None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[FormulaOutcome]:
+    """Evaluate formulas in order over all rows with a known variant.
+
+    Each formula's results are written back into the store so later formulas
+    can reference them by their cleaned term name. When an incremental
+    `tracker` is given, rows it already holds results for are not recomputed;
+    a `memo` evaluates each formula once per unique tuple of its inputs.
+
+    Rows are processed in contiguous chunks. After each chunk `progress` (if
+    given) is told how many rows finished and how many evaluations failed per
+    formula; before each chunk it is asked whether the run was cancelled, in
+    which case EvaluationCancelled is raised.
+    """
+    plans = _plan_formulas(store, formulas, row_variants, tracker)
+    chunk_size = max(1, int(chunk_size))
+
+    for start in range(0, store.n_rows, chunk_size):
+        if progress is not None and progress.cancelled():
+            raise EvaluationCancelled()
+        stop = min(start + chunk_size, store.n_rows)
+
+        failures = {}
+        for plan in plans:
+            outcome = plan.outcome
+            for name, table in plan.lookups.items():
+                store.add_lookup(name, table, start, stop)
+
+            for compiled, rows in plan.groups:
+                rows = rows[np.searchsorted(rows, start):np.searchsorted(rows, stop)]
+                if plan.reuse is not None:
+                    rows = rows[~plan.reuse.hit[rows]]
+                if len(rows) == 0:
+                    continue
+                if memo is not None:
+                    group_values, group_ok = memo.evaluate(compiled, store, rows, outcome.term,
+                                                           salt=tuple(plan.table_fingerprints))
+                else:
+                    group_values, group_ok = evaluate_compiled(compiled, store, rows)
+                outcome.values[rows] = group_values
+                outcome.ok[rows] = group_ok
+
+            store.update_range(outcome.column, start, stop, outcome.values[start:stop], outcome.ok[start:stop])
+            failed = int(np.count_nonzero(outcome.attempted[start:stop] & ~outcome.ok[start:stop]))
+            if failed:
+                failures[outcome.term] = failures.get(outcome.term, 0) + failed
+
+        if progress is not None:
+            progress.advance(stop - start, failures)
+
+    outcomes = [plan.outcome for plan in plans]
+    if tracker is not None:
+        for outcome in outcomes:
+            tracker.finish_formula(outcome.index, outcome.values, outcome.ok, outcome.attempted)
+    return outcomes
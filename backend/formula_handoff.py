@@ -0,0 +1,143 @@
+"""Hand-off of formula sets from the extraction service to the processor.
+
+The extractor forwards a compact, versioned payload: only the fields the
+processor evaluates, plus a content hash so an unchanged set is recognised.
+Requests go through one pooled session with timeouts and retries. When both
+Flask apps run in one process (IN_PROCESS_PROCESSOR=true), formulas and
+factor tables are written straight into the shared registries instead.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import List, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from factor_tables import FACTOR_TABLES, FactorTable
+
+PAYLOAD_VERSION = 1
+# The only formula fields the processor reads
+PROCESSOR_FIELDS = ('term_description', 'mathematical_relationship', 'variants')
+
+class HandoffError(ValueError):
+    """Raised for a formula payload the processor cannot accept"""
+
+def compact_formula(formula: Dict) -> Dict:
+    compact = {
+        'term_description': str(formula.get('term_description') or '').strip(),
+        'mathematical_relationship': str(formula.get('mathematical_relationship') or '')
+    }
+    variants = formula.get('variants')
+    if isinstance(variants, dict) and variants:
+        compact['variants'] = {str(name): str(expr) for name, expr in variants.items()}
+    return compact
+
+def formula_set_hash(formulas: List[Dict]) -> str:
+    canonical = json.dumps(formulas, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def build_payload(formulas: List[Dict]) -> Dict:
+    compact = [compact_formula(formula) for formula in formulas]
+    return {"version": PAYLOAD_VERSION, "hash": formula_set_hash(compact), "formulas": compact}
+
+def parse_payload(data) -> Tuple[List[Dict], str]:
+    """Compact formulas and their hash from a versioned payload.
+
+    A bare list of formulas, or the frontend's {"formulas": [...], ...} body,
+    is accepted too and compacted here.
+    """
+    if isinstance(data, list):
+        formulas = data
+    elif isinstance(data, dict) and isinstance(data.get('formulas'), list):
+        version = data.get('version', PAYLOAD_VERSION)
+        if version != PAYLOAD_VERSION:
+            raise HandoffError(f"Unsupported formula payload version {version}")
+        formulas = data['formulas']
+    else:
+        raise HandoffError("Expected a list of formulas or an object with a 'formulas' list")
+    if not all(isinstance(formula, dict) for formula in formulas):
+        raise HandoffError("Every formula must be an object")
+
+    compact = [compact_formula(formula) for formula in formulas]
+    digest = formula_set_hash(compact)
+    if isinstance(data, dict) and data.get('hash') and data['hash'] != digest:
+        raise HandoffError("Formula payload hash does not match its content")
+    return compact, digest
+
+class FormulaRegistry:
+    """The formula set the processor evaluates, replaced as a whole"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._formulas: List[Dict] = []
+        self.digest: Optional[str] = None
+        self.stored_at: Optional[float] = None
+
+    def replace(self, formulas: List[Dict], digest: str) -> bool:
+        """Store a new set; returns False when it is the set already stored"""
+        with self._lock:
+            if digest == self.digest:
+                return False
+            self._formulas = formulas
+            self.digest = digest
+            self.stored_at = time.time()
+            return True
+
+    @property
+    def formulas(self) -> List[Dict]:
+        """The current set; a run keeps its list even if a new set is stored meanwhile"""
+        return self._formulas
+
+    def __len__(self):
+        return len(self._formulas)
+
+    def describe(self) -> Dict:
+        return {"count": len(self._formulas), "hash": self.digest, "stored_at": self.stored_at}
+
+FORMULA_REGISTRY = FormulaRegistry()
+
+class ProcessorClient:
+    """Forwards formula sets and factor tables to the processor service"""
+
+    def __init__(self, base_url: str, in_process: bool = False, timeout: Tuple[float, float] = (3.05, 30.0),
+                 retries: int = 3):
+        self.base_url = base_url.rstrip('/')
+        self.in_process = in_process
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Storing a formula set or a table replaces it, so POSTs are safe to retry
+        retry = Retry(total=retries, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({'GET', 'POST', 'DELETE'}))
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def transport(self) -> str:
+        return 'in-process' if self.in_process else 'http'
+
+    def store_formulas(self, data) -> Tuple[Dict, int]:
+        """Hand a formula set over; returns the processor's response body and status"""
+        formulas, digest = parse_payload(data)
+        if self.in_process:
+            changed = FORMULA_REGISTRY.replace(formulas, digest)
+            return {
+                "message": "Stored extracted formulas",
+                "count": len(formulas),
+                "hash": digest,
+                "unchanged": not changed
+            }, 200
+        payload = {"version": PAYLOAD_VERSION, "hash": digest, "formulas": formulas}
+        response = self.session.post(f"{self.base_url}/store-formulas", json=payload, timeout=self.timeout)
+        return response.json(), response.status_code
+
+    def store_factor_table(self, table: FactorTable) -> Tuple[bool, str]:
+        """Hand a factor table over; returns (stored, error message)"""
+        if self.in_process:
+            FACTOR_TABLES.add(table)
+            return True, ''
+        response = self.session.post(f"{self.base_url}/factor-tables", json=table.to_dict(), timeout=self.timeout)
+        return response.ok, '' if response.ok else response.text
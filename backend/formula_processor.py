@@ -1,29 +1,66 @@
 import os
 import pandas as pd
 import numpy as np
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import traceback
-import re
-import math
+import json
+import time
+import uuid
 from typing import List, Dict, Any
 
+from formula_engine import (
+    DEFAULT_CHUNK_SIZE, ColumnStore, EvaluationCancelled, clean_column_name, evaluate_formula_set,
+    expression_for_variant, formula_backend_name, formula_dependencies
+)
+from excel_functions import serial_to_datetime
+from factor_tables import FACTOR_TABLES, FactorTable, FactorTableError, LOOKUP_METHODS
+from result_cache import FormulaMemo, IncrementalCache
+from preflight import DEFAULT_SAMPLE_PER_VARIANT, run_preflight
+from run_progress import ProgressRegistry
+from alias_index import ALIAS_INDEX, match_columns
+from formula_handoff import FORMULA_REGISTRY, HandoffError, parse_payload
+from download_store import RetentionSweeper, available_encodings, compressed_variant, negotiate_encoding
+
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:4200", "http://127.0.0.1:4200"])
 
 UPLOAD_FOLDER = 'data_uploads'
 PROCESSED_FOLDER = 'processed_files'
+FACTOR_FOLDER = 'factor_tables'
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
+app.config['FACTOR_FOLDER'] = FACTOR_FOLDER
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
 
-# Global storage for formulas
-dynamic_formulas: List[Dict] = []
+# Factor tables uploaded once and reused by every run
+FACTOR_TABLES.folder = FACTOR_FOLDER
+FACTOR_TABLES.load()
+
+# Results of the previous run, reused by incremental processing
+incremental_cache = IncrementalCache()
+
+# Formula results keyed on the input values each formula reads
+formula_memo = FormulaMemo(max_entries=int(os.getenv('FORMULA_MEMO_SIZE', '100000')))
+
+# Live progress and cancellation of /process-data runs, by run_id
+run_progress = ProgressRegistry()
+
+# Processed files are deleted once too old, or oldest first while the folder is too large
+retention_sweeper = RetentionSweeper(
+    PROCESSED_FOLDER,
+    max_age_seconds=float(os.getenv('PROCESSED_MAX_AGE_HOURS', '168')) * 3600,
+    max_bytes=int(float(os.getenv('PROCESSED_MAX_MB', '1024')) * 2 ** 20),
+    interval=float(os.getenv('PROCESSED_SWEEP_SECONDS', '300'))
+)
+retention_sweeper.start()
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
 VARIANT_MAP = {
     'L190A01': 'Variant 1',
@@ -36,234 +73,251 @@ VARIANT_MAP = {
 
 @app.route('/store-formulas', methods=['POST'])
 def store_formulas():
-    global dynamic_formulas
+    """Replace the formula set, from a versioned payload (formula_handoff) or a plain list"""
     try:
-        data = request.get_json()
-        dynamic_formulas = data if isinstance(data, list) else []
-        print(f"Stored {len(dynamic_formulas)} formulas")
-        for i, formula in enumerate(dynamic_formulas):
-            print(f"Formula {i+1}: {formula.get('term_description', 'Unknown')}")
-            print(f"  Expression: {formula.get('mathematical_relationship', 'No expression')}")
-        return jsonify({"message": "Stored extracted formulas", "count": len(dynamic_formulas)}), 200
+        formulas, digest = parse_payload(request.get_json())
+        changed = FORMULA_REGISTRY.replace(formulas, digest)
+        print(f"Stored {len(formulas)} formulas ({digest[:12]}{'' if changed else ', unchanged'})")
+        return jsonify({
+            "message": "Stored extracted formulas",
+            "count": len(formulas),
+            "hash": digest,
+            "unchanged": not changed
+        }), 200
+    except HandoffError as e:
+        return jsonify({"message": str(e), "status": "error"}), 400
     except Exception as e:
         print(f"Error storing formulas: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-def clean_column_name(name: str) -> str:
-    """Clean column name for consistent matching"""
-    return str(name).strip().lower().replace(' ', '_').replace('%', 'percent').replace('*', '')
+def read_uploaded_table(file):
+    """Read an uploaded csv/xlsx file; returns (DataFrame, None) or (None, error response)"""
+    filename = secure_filename(file.filename)
+    if not filename or '.' not in filename:
+        return None, (jsonify({"message": "Invalid file name."}), 400)
 
-def prepare_context(row: pd.Series) -> Dict[str, float]:
-    """Prepare context dictionary with cleaned column names"""
-    context = {}
-    for col, val in row.items():
-        clean_col = clean_column_name(col)
-        # Convert to numeric, default to 0 if not possible
-        try:
-            if pd.isna(val) or val == '' or val is None:
-                context[clean_col] = 0.0
-            else:
-                context[clean_col] = float(val)
-        except (ValueError, TypeError):
-            context[clean_col] = 0.0
-    
-    # Add common mathematical functions to context
-    context.update({
-        'max': max,
-        'min': min,
-        'abs': abs,
-        'round': round,
-        'sqrt': math.sqrt,
-        'exp': math.exp,
-        'log': math.log,
-        'sin': math.sin,
-        'cos': math.cos,
-        'tan': math.tan,
-        'pi': math.pi,
-        'e': math.e
-    })
-    
-    return context
+    file_ext = filename.rsplit('.', 1)[1].lower()
+    if file_ext not in ALLOWED_EXTENSIONS:
+        return None, (jsonify({"message": f"Unsupported file type: {file_ext}"}), 415)
 
-def safe_eval(expr: str, context: dict) -> float:
-    """Safely evaluate mathematical expressions"""
+    # Read the file
     try:
-        if not expr or expr.strip() == '':
-            return None
-            
-        # Clean the expression
-        expr = str(expr).strip()
-        
-        # Handle common mathematical patterns
-        expr = expr.replace('^', '**')  # Convert ^ to ** for power
-        expr = expr.replace('×', '*')   # Convert × to *
-        expr = expr.replace('÷', '/')   # Convert ÷ to /
-        
-        # Replace variable names with their values
-        # Find all variable names (letters, underscores, numbers)
-        pattern = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b')
-        
-        def replace_var(match):
-            var_name = match.group().lower()
-            if var_name in context:
-                return str(context[var_name])
-            else:
-                print(f"Warning: Variable '{var_name}' not found in context")
-                return '0'  # Default to 0 for missing variables
-        
-        expr_with_values = pattern.sub(replace_var, expr)
-        
-        print(f"Evaluating: {expr} -> {expr_with_values}")
-        
-        # Evaluate the expression
-        result = eval(expr_with_values, {"__builtins__": {}}, context)
-        
-        # Ensure result is numeric
-        if isinstance(result, (int, float)) and not (math.isnan(result) or math.isinf(result)):
-            return float(result)
-        else:
-            return None
-            
+        if 'xls' in file_ext:
+            return pd.read_excel(file), None
+        return pd.read_csv(file), None
     except Exception as e:
-        print(f"Error evaluating expression '{expr}': {str(e)}")
-        return None
+        return None, (jsonify({"message": f"Error reading file: {str(e)}"}), 400)
+
+def apply_outcome(df: pd.DataFrame, original_columns: List[str], outcome) -> None:
+    """Write a formula's successful results into the output frame"""
+    if not outcome.ok.any():
+        return
+    if outcome.is_date:
+        rounded = pd.Series(serial_to_datetime(outcome.values), index=df.index)
+    else:
+        rounded = pd.Series(np.round(outcome.values, 2), index=df.index)
+    ok = pd.Series(outcome.ok, index=df.index)
+
+    original_col_name = None
+    for col in original_columns:
+        if clean_column_name(col) == outcome.column:
+            original_col_name = col
+            break
+
+    if original_col_name:
+        # If column exists, only fill if value is missing/null
+        current = df[original_col_name]
+        missing = current.isna() | (current.astype(str).str.strip() == '') | (pd.to_numeric(current, errors='coerce') == 0)
+        df[original_col_name] = current.where(~(ok & missing), rounded)
+    elif outcome.column in df.columns:
+        df[outcome.column] = df[outcome.column].where(~ok, rounded)
+    else:
+        # Create new column
+        df[outcome.column] = rounded.where(ok)
+
+def collect_errors(outcomes, formulas: List[Dict], row_variants: np.ndarray, unknown_rows: np.ndarray,
+                   cover_codes: np.ndarray, limit: int = 10):
+    """Count all row errors and render only the first `limit` in row order"""
+    total = len(unknown_rows)
+    pending = [(int(row), -1) for row in unknown_rows[:limit]]
+    for outcome in outcomes:
+        failed_rows = np.flatnonzero(outcome.failed)
+        total += len(failed_rows)
+        pending.extend((int(row), outcome.index) for row in failed_rows[:limit])
+
+    messages = []
+    for row, formula_idx in sorted(pending)[:limit]:
+        if formula_idx < 0:
+            messages.append(f"Row {row + 2}: Unknown COVER_CODE '{cover_codes[row]}'")
+        else:
+            formula = formulas[formula_idx]
+            term = formula.get('term_description', '').strip()
+            expr = expression_for_variant(formula, row_variants[row])
+            messages.append(f"Row {row + 2}: Could not evaluate formula '{term}' with expression '{expr}'")
+    return messages, total
+
+def resolve_row_variants(df: pd.DataFrame):
+    """Cover codes and the variant of every row (None where the code is unknown)"""
+    if 'COVER_CODE' in df.columns:
+        cover_codes = df['COVER_CODE'].astype(str).str.strip()
+    else:
+        cover_codes = pd.Series('', index=df.index)
+    return cover_codes, cover_codes.map(VARIANT_MAP).to_numpy(dtype=object)
+
+def resolve_column_aliases(df: pd.DataFrame, formulas: List[Dict]) -> Dict:
+    """Upload columns holding formula variables under another name (e.g. Issue Age for entry_age)"""
+    variant_names = sorted(set(VARIANT_MAP.values()))
+    present = {clean_column_name(col) for col in df.columns}
+    outputs = {clean_column_name(formula.get('term_description', '').strip()) for formula in formulas}
+    missing = [
+        name for name in sorted(formula_dependencies(formulas, variant_names))
+        if name not in present and name not in outputs and name not in FACTOR_TABLES
+    ]
+    if not missing:
+        return {}
+    ALIAS_INDEX.refresh()
+    matches = match_columns(missing, df.columns, ALIAS_INDEX)
+    for name, match in matches.items():
+        print(f"Variable '{name}' read from column '{match.target}' ({match.method} match)")
+    return matches
+
+def warn_fuzzy_aliases(report, column_aliases: Dict):
+    for name, match in column_aliases.items():
+        if match.method == 'fuzzy':
+            report.warning(f"'{name}' is read from column '{match.target}' (fuzzy match, score {match.score}); "
+                           f"confirm the mapping through /aliases")
+        elif match.method == 'generic':
+            report.warning(f"'{name}' is read from column '{match.target}' through the generic term "
+                           f"{' -> '.join(match.chain)}; confirm the mapping through /aliases")
+
+def preflight_failed_response(report, run_id=None):
+    first = report.errors[0].message
+    more = f" (and {len(report.errors) - 1} more)" if len(report.errors) > 1 else ""
+    body = {
+        "message": f"Preflight failed: {first}{more}",
+        "status": "error",
+        "preflight": report.to_dict()
+    }
+    if run_id:
+        body["run_id"] = run_id
+    return jsonify(body), 422
+
+def cancelled_response(progress):
+    progress.set_status('cancelled', 'Cancelled by request')
+    print(f"Run {progress.run_id} cancelled after {progress.rows_done} rows")
+    return jsonify({
+        "message": "Processing cancelled.",
+        "status": "cancelled",
+        "run_id": progress.run_id,
+        "progress": progress.snapshot()
+    }), 409
 
 @app.route('/process-data', methods=['POST'])
 def process_data():
-    global dynamic_formulas
+    # Clients may pick the run_id up front so they can watch or cancel the run while it is posted
+    run_id = request.form.get('run_id', '').strip() or uuid.uuid4().hex
+    if run_id in run_progress and not run_progress.get(run_id).finished:
+        return jsonify({"message": f"Run {run_id} is already in progress.", "status": "error"}), 409
+    try:
+        interval = max(float(request.form.get('progress_interval', '1.0')), 0.1)
+        chunk_size = max(int(request.form.get('chunk_size', DEFAULT_CHUNK_SIZE)), 1)
+    except ValueError:
+        return jsonify({"message": "progress_interval and chunk_size must be numbers.", "status": "error"}), 400
+    progress = run_progress.create(run_id, interval=interval)
+    # The formula set at the start of the run, even if a new one is stored meanwhile
+    dynamic_formulas = FORMULA_REGISTRY.formulas
+
     try:
         if 'file' not in request.files:
+            progress.set_status('failed', 'No file uploaded')
             return jsonify({"message": "No file uploaded."}), 400
 
-        file = request.files['file']
-        filename = secure_filename(file.filename)
-        if not filename:
-            return jsonify({"message": "Invalid file name."}), 400
-
-        file_ext = filename.rsplit('.', 1)[1].lower()
-        if file_ext not in ALLOWED_EXTENSIONS:
-            return jsonify({"message": f"Unsupported file type: {file_ext}"}), 415
-
-        # Read the file
-        try:
-            if 'xls' in file_ext:
-                df = pd.read_excel(file)
-            else:
-                df = pd.read_csv(file)
-        except Exception as e:
-            return jsonify({"message": f"Error reading file: {str(e)}"}), 400
+        df, error = read_uploaded_table(request.files['file'])
+        if error:
+            progress.set_status('failed', 'Could not read the uploaded file')
+            return error
 
         print(f"Original DataFrame shape: {df.shape}")
         print(f"Columns: {list(df.columns)}")
 
         # Clean column names
         df.columns = df.columns.str.strip()
-        
-        # Create a copy for processing
-        filled_df = df.copy()
-        
-        processed = 0
-        errors = []
-        successful_calculations = 0
-        
+        original_columns = list(df.columns)
+
+        # Resolve each row's variant once, as a column
+        cover_codes, row_variants = resolve_row_variants(df)
+        known_variant = pd.notna(row_variants)
+        processed = int(known_variant.sum())
+
+        # Variables the upload holds under another name are read from that column
+        column_aliases = resolve_column_aliases(df, dynamic_formulas)
+        aliases = {name: match.target for name, match in column_aliases.items()}
+
+        # Check formulas against the header and a sample of rows before the full pass
+        report = None
+        if request.form.get('skip_preflight', 'false').lower() != 'true':
+            progress.set_status('preflight')
+            report = run_preflight(df, dynamic_formulas, row_variants, aliases=aliases)
+            warn_fuzzy_aliases(report, column_aliases)
+            print(f"Preflight: {len(report.errors)} errors, {len(report.issues) - len(report.errors)} warnings "
+                  f"on {report.sampled_rows} sampled rows in {report.elapsed_ms} ms")
+            if not report.passed:
+                progress.set_status('failed', 'Preflight failed')
+                return preflight_failed_response(report, run_id)
+
         print(f"Processing {len(df)} rows with {len(dynamic_formulas)} formulas")
 
-        # Process each row
-        for idx, row in df.iterrows():
-            try:
-                # Get cover code and variant
-                cover_code = str(row.get('COVER_CODE', '')).strip()
-                variant = VARIANT_MAP.get(cover_code)
-
-                if not variant:
-                    errors.append(f"Row {idx + 2}: Unknown COVER_CODE '{cover_code}'")
-                    continue
-
-                # Prepare context with current row values
-                context = prepare_context(row)
-                computed_this_row = {}
-
-                print(f"\nProcessing row {idx + 2}, Cover Code: {cover_code}, Variant: {variant}")
-
-                # Apply each formula
-                for formula_idx, formula in enumerate(dynamic_formulas):
-                    try:
-                        term = formula.get('term_description', '').strip()
-                        math_expr = formula.get('mathematical_relationship', '')
-                        
-                        # Check if formula has variant-specific expressions
-                        variants = formula.get('variants', {})
-                        if variants and variant in variants:
-                            expr = variants[variant]
-                        else:
-                            expr = math_expr
-
-                        if not expr:
-                            continue
-
-                        print(f"  Applying formula {formula_idx + 1}: {term}")
-                        print(f"    Expression: {expr}")
-
-                        # Update context with previously computed values
-                        context.update(computed_this_row)
-
-                        # Evaluate the formula
-                        result = safe_eval(expr, context)
-
-                        if result is not None:
-                            # Create column name
-                            col_name = clean_column_name(term)
-                            
-                            # Check if we should only fill missing values
-                            original_col_name = None
-                            for col in df.columns:
-                                if clean_column_name(col) == col_name:
-                                    original_col_name = col
-                                    break
-                            
-                            # If column exists, only fill if value is missing/null
-                            if original_col_name:
-                                current_value = filled_df.loc[idx, original_col_name]
-                                if pd.isna(current_value) or current_value == '' or current_value == 0:
-                                    filled_df.loc[idx, original_col_name] = round(result, 2)
-                                    print(f"    Filled missing value: {round(result, 2)}")
-                                else:
-                                    print(f"    Existing value kept: {current_value}")
-                            else:
-                                # Create new column
-                                filled_df.loc[idx, col_name] = round(result, 2)
-                                print(f"    Created new column: {col_name} = {round(result, 2)}")
-                            
-                            # Store for use in subsequent formulas
-                            computed_this_row[col_name] = result
-                            successful_calculations += 1
-                            
-                        else:
-                            errors.append(f"Row {idx + 2}: Could not evaluate formula '{term}' with expression '{expr}'")
-                            print(f"    Failed to evaluate: {expr}")
-
-                    except Exception as formula_error:
-                        error_msg = f"Row {idx + 2}, Formula '{term}': {str(formula_error)}"
-                        errors.append(error_msg)
-                        print(f"    Formula error: {str(formula_error)}")
-
-                processed += 1
-
-            except Exception as row_error:
-                error_msg = f"Row {idx + 2}: {str(row_error)}"
-                errors.append(error_msg)
-                print(f"Row error: {str(row_error)}")
-
-        # Generate output filename
+        # Build the columnar store with only the variables the formulas read
+        variant_names = sorted(set(VARIANT_MAP.values()))
+        needed = formula_dependencies(dynamic_formulas, variant_names)
+        store = ColumnStore.from_frame(df, needed, aliases)
+        print(f"Columnar store: {len(store.values)} columns x {store.n_rows} rows")
+
+        # Incremental mode reuses previous results for unchanged rows and formulas
+        incremental = request.form.get('incremental', 'false').lower() == 'true'
+        tracker = incremental_cache.start_run(store, row_variants) if incremental else None
+
+        # Memoization evaluates each formula once per unique tuple of its inputs
+        memoize = request.form.get('memoize', 'false').lower() == 'true'
+        memo_run = formula_memo.start_run() if memoize else None
+
+        progress.start(store.n_rows)
+        try:
+            outcomes = evaluate_formula_set(
+                store, dynamic_formulas, row_variants,
+                tracker=tracker, memo=memo_run, progress=progress, chunk_size=chunk_size
+            )
+        except EvaluationCancelled:
+            return cancelled_response(progress)
+
+        if tracker is not None:
+            tracker.commit()
+            print(f"Incremental run: {tracker.stats.to_dict()}")
+
+        successful_calculations = 0
+        for outcome in outcomes:
+            successful_calculations += int(outcome.ok.sum())
+            apply_outcome(df, original_columns, outcome)
+
+        unknown_rows = np.flatnonzero(~known_variant)
+        errors_shown, total_errors = collect_errors(
+            outcomes, dynamic_formulas, row_variants, unknown_rows, cover_codes.to_numpy()
+        )
+
+        if not progress.start_writing():
+            return cancelled_response(progress)
+
+        # Generate output filename, unique even for runs in the same second
         timestamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
-        output_filename = f"processed_output_{timestamp}.xlsx"
+        output_filename = f"processed_output_{timestamp}_{uuid.uuid4().hex[:8]}.xlsx"
         output_path = os.path.join(app.config['PROCESSED_FOLDER'], output_filename)
         
         # Save the processed file
         try:
-            filled_df.to_excel(output_path, index=False)
+            df.to_excel(output_path, index=False)
             print(f"Saved processed file: {output_path}")
         except Exception as save_error:
+            progress.set_status('failed', f"Error saving file: {str(save_error)}")
             return jsonify({"message": f"Error saving file: {str(save_error)}"}), 500
 
         # Create summary
@@ -271,55 +325,225 @@ def process_data():
             "total_policies": len(df),
             "processed_policies": processed,
             "successful_calculations": successful_calculations,
-            "error_count": len(errors),
+            "error_count": total_errors,
             "warning_count": 0,
             "formulas_used": len(dynamic_formulas),
-            "new_columns_created": len([col for col in filled_df.columns if col not in df.columns])
+            "new_columns_created": len(df.columns) - len(original_columns),
+            "formula_backend": formula_backend_name()
         }
-
+        if column_aliases:
+            result_summary["column_aliases"] = {name: match.to_dict() for name, match in column_aliases.items()}
+        if report is not None:
+            result_summary["preflight"] = report.to_dict()
+        if tracker is not None:
+            result_summary["incremental"] = tracker.stats.to_dict()
+        if memo_run is not None:
+            result_summary["memoization"] = memo_run.to_dict()
+
+        progress.set_status('completed')
+        result_summary["elapsed_seconds"] = progress.snapshot()["elapsed_seconds"]
         print(f"Processing complete: {result_summary}")
 
         return jsonify({
             "message": f"Processed {processed} policies with {successful_calculations} successful calculations.",
-            "status": "success" if len(errors) == 0 else "warning",
+            "status": "success" if total_errors == 0 else "warning",
+            "run_id": run_id,
             "download_ready": True,
             "output_filename": output_filename,
             "processing_result": {
                 "processed_policies": processed,
                 "successful_calculations": successful_calculations,
-                "errors": errors[:10],  # Limit errors shown
+                "errors": errors_shown,  # Limit errors shown
                 "warnings": [],
                 "output_file_path": output_path,
                 "processing_summary": result_summary,
-                "total_errors": len(errors)
+                "total_errors": total_errors
             }
         }), 200
 
     except Exception as e:
         print(f"Processing failed: {str(e)}")
         print(traceback.format_exc())
+        progress.set_status('failed', str(e))
         return jsonify({
             "message": f"Processing failed: {str(e)}", 
-            "status": "error"
+            "status": "error",
+            "run_id": run_id
         }), 500
 
+@app.route('/preflight', methods=['POST'])
+def preflight():
+    """Run only the preflight checks on an upload"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({"message": "No file uploaded."}), 400
+
+        df, error = read_uploaded_table(request.files['file'])
+        if error:
+            return error
+        df.columns = df.columns.str.strip()
+
+        _, row_variants = resolve_row_variants(df)
+        formulas = FORMULA_REGISTRY.formulas
+        column_aliases = resolve_column_aliases(df, formulas)
+        sample_size = int(request.form.get('sample_per_variant', DEFAULT_SAMPLE_PER_VARIANT))
+        report = run_preflight(df, formulas, row_variants, sample_per_variant=max(sample_size, 1),
+                               aliases={name: match.target for name, match in column_aliases.items()})
+        warn_fuzzy_aliases(report, column_aliases)
+        if not report.passed:
+            return preflight_failed_response(report)
+        return jsonify({
+            "message": "Preflight passed.",
+            "status": "success",
+            "preflight": report.to_dict(),
+            "column_aliases": {name: match.to_dict() for name, match in column_aliases.items()}
+        }), 200
+
+    except Exception as e:
+        print(f"Preflight failed: {str(e)}")
+        return jsonify({"message": f"Preflight failed: {str(e)}", "status": "error"}), 500
+
+@app.route('/process-data/<run_id>/progress', methods=['GET'])
+def process_data_progress(run_id):
+    progress = run_progress.get(run_id)
+    if progress is None:
+        return jsonify({"message": f"Run {run_id} not found."}), 404
+    return jsonify(progress.snapshot())
+
+@app.route('/process-data/<run_id>/events', methods=['GET'])
+def process_data_events(run_id):
+    """Server-sent events with a progress snapshot every interval until the run ends"""
+    progress = run_progress.get(run_id)
+    if progress is None:
+        return jsonify({"message": f"Run {run_id} not found."}), 404
+
+    def generate():
+        while True:
+            snapshot = progress.snapshot()
+            yield f"event: progress\ndata: {json.dumps(snapshot)}\n\n"
+            if progress.finished:
+                yield f"event: {snapshot['status']}\ndata: {json.dumps(snapshot)}\n\n"
+                return
+            time.sleep(progress.interval)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/process-data/<run_id>/cancel', methods=['POST'])
+def cancel_process_data(run_id):
+    progress = run_progress.get(run_id)
+    if progress is None:
+        return jsonify({"message": f"Run {run_id} not found."}), 404
+    if progress.finished:
+        return jsonify({"message": f"Run {run_id} already {progress.status}.", "status": progress.status}), 409
+    if not progress.cancel():
+        return jsonify({"message": f"Run {run_id} is already writing its output file.", "status": progress.status}), 409
+    return jsonify({"message": f"Cancellation requested for run {run_id}.", "status": "cancelling"}), 202
+
 @app.route('/download/<filename>', methods=['GET'])
 def download_file(filename):
+    """Serve a processed file.
+
+    Supports ETag / If-None-Match, If-Modified-Since and Range requests, and
+    serves a gzip or zstd copy when the client accepts one and it is smaller.
+    """
     try:
         path = os.path.join(app.config['PROCESSED_FOLDER'], filename)
-        if os.path.exists(path):
-            return send_file(path, as_attachment=True, download_name=filename)
-        else:
+        if secure_filename(filename) != filename or not os.path.isfile(path):
             return jsonify({"message": "File not found."}), 404
+
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+        served_path = compressed_variant(path, encoding) if encoding else None
+        response = send_file(
+            served_path or path,
+            mimetype=XLSX_MIMETYPE,
+            as_attachment=True,
+            download_name=filename,
+            conditional=True
+        )
+        if served_path:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
     except Exception as e:
         print(f"Download error: {str(e)}")
         return jsonify({"message": f"Download failed: {str(e)}"}), 500
 
+@app.route('/factor-tables', methods=['POST'])
+def upload_factor_table():
+    """Upload a factor table (e.g. SV_FACTOR) once for use by every /process-data run.
+
+    Form fields: file, name, keys (comma-separated key columns), and either
+    value (long layout) or column_key (wide layout, one column per key value).
+    Optional method: exact (default), step or interpolate.
+
+    A JSON body (FactorTable.to_dict) stores an already indexed table, e.g.
+    one extracted from a document by the extraction service.
+    """
+    try:
+        if request.is_json:
+            table = FactorTable.from_dict(request.get_json())
+            FACTOR_TABLES.add(table)
+            print(f"Stored factor table {table.name}: keys {table.key_columns}, shape {table.grid.shape}")
+            return jsonify({"message": f"Stored factor table {table.name}", "table": table.describe()}), 200
+
+        if 'file' not in request.files:
+            return jsonify({"message": "No file uploaded."}), 400
+
+        df, error = read_uploaded_table(request.files['file'])
+        if error:
+            return error
+
+        name = request.form.get('name', '').strip()
+        keys = [key.strip() for key in request.form.get('keys', '').split(',') if key.strip()]
+        if not name or not keys:
+            return jsonify({"message": "Both 'name' and 'keys' are required."}), 400
+
+        method = request.form.get('method', 'exact').strip().lower()
+        if method not in LOOKUP_METHODS:
+            return jsonify({"message": f"Unknown method '{method}'. Use one of: {', '.join(LOOKUP_METHODS)}"}), 400
+
+        table = FactorTable.from_frame(
+            name,
+            df,
+            keys,
+            value_column=request.form.get('value') or None,
+            column_key=request.form.get('column_key') or None,
+            method=method
+        )
+        FACTOR_TABLES.add(table)
+        print(f"Stored factor table {table.name}: keys {table.key_columns}, shape {table.grid.shape}")
+        return jsonify({"message": f"Stored factor table {table.name}", "table": table.describe()}), 200
+
+    except FactorTableError as e:
+        return jsonify({"message": str(e)}), 400
+    except Exception as e:
+        print(f"Error storing factor table: {str(e)}")
+        return jsonify({"message": f"Error storing factor table: {str(e)}"}), 500
+
+@app.route('/factor-tables', methods=['GET'])
+def list_factor_tables():
+    return jsonify({"tables": FACTOR_TABLES.describe(), "count": len(FACTOR_TABLES)})
+
+@app.route('/factor-tables/<name>', methods=['DELETE'])
+def delete_factor_table(name):
+    if FACTOR_TABLES.remove(name):
+        return jsonify({"message": f"Removed factor table {name.upper()}"}), 200
+    return jsonify({"message": f"Factor table {name.upper()} not found."}), 404
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         "status": "healthy",
-        "formulas_loaded": len(dynamic_formulas),
+        "formulas_loaded": len(FORMULA_REGISTRY),
+        "formula_set": FORMULA_REGISTRY.describe(),
+        "factor_tables_loaded": len(FACTOR_TABLES),
+        "alias_index": ALIAS_INDEX.describe(),
+        "formula_backend": formula_backend_name(),
+        "download_encodings": available_encodings(),
+        "retention": retention_sweeper.describe(),
         "upload_folder": app.config['UPLOAD_FOLDER'],
         "processed_folder": app.config['PROCESSED_FOLDER']
     })
@@ -329,11 +553,16 @@ def home():
     return jsonify({
         "message": "Formula Processor API is running",
         "status": "ok",
-        "formulas_loaded": len(dynamic_formulas),
+        "formulas_loaded": len(FORMULA_REGISTRY),
         "endpoints": [
             "/store-formulas", 
             "/process-data", 
+            "/process-data/<run_id>/progress",
+            "/process-data/<run_id>/events",
+            "/process-data/<run_id>/cancel",
+            "/preflight",
             "/download/<filename>",
+            "/factor-tables",
             "/health"
         ]
     })
@@ -342,4 +571,5 @@ if __name__ == '__main__':
     print("🧮 Formula Processor running on http://127.0.0.1:5001")
     print("📁 Upload folder:", UPLOAD_FOLDER)
     print("📁 Processed folder:", PROCESSED_FOLDER)
+    print("⚙️ Formula backend:", formula_backend_name())
     app.run(host='127.0.0.1', port=5001, debug=True)
\ No newline at end of file
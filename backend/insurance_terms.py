@@ -0,0 +1,67 @@
+"""Generic insurance terms shared by the extraction and processing services.
+
+An entry whose description is another term's name (ISSUE_AGE: ENTRY_AGE) is an
+alias of that term; alias_index builds its alias chains from these entries.
+"""
+
+GENERIC_INSURANCE_TERMS = {
+    'TERM_START_DATE': 'Policy commencement date',
+    'DATE_OF_COMMENCEMENT': 'TERM_START_DATE',
+    'ENTRY_AGE': 'Age of the policyholder at policy inception',
+    'BENEFIT_TERM': 'Duration for which benefits are payable in months',
+    'ISSUE_AGE': 'ENTRY_AGE',
+    'PREMIUM': 'Premium amount (annual/monthly/quarterly)',
+    'FULL_TERM_PREMIUM': 'PREMIUM',
+    'ANNUALISED_PREMIUM': 'Annual premium amount',
+    'POLICY_YEAR':'ROUND(YEARFRAC(TERM_START_DATE, DATE_OF_SURRENDER)+1,0)',
+    'MONTHLY_PREMIUM': 'Monthly premium amount',
+    'PREMIUM_FREQUENCY': 'Frequency of premium payment',
+    'BOOKING_FREQUENCY': 'Frequency of premium booking',
+    'BOOKING_TIME': 'Duration for premium booking in years',
+    'POLICY_TERM': 'Total duration of the policy',
+    'PREMIUM_TERM': 'Premium Paying Term - duration for paying premiums',
+    'SA': 'Sum Assured - guaranteed amount on maturity/death',
+    'SUM_ASSURED': 'Basic sum assured amount',
+    'DEATH_BENEFIT': 'Benefit payable on death',
+    'MATURITY_BENEFIT': 'Benefit payable on maturity',
+    'INCOME_BENEFIT_AMOUNT': 'Amount of income benefit',
+    'INCOME_BENEFIT_FREQUENCY': 'Frequency of income benefit payout',
+    'SURRENDER_DATE': 'Date when policy is surrendered',
+    'MATURITY_DATE': 'EDATE(TERM_START_DATE,(BENEFIT_TERM*12))',
+    'FUP': 'First Unpaid Premium date',
+    'FIRST_UNPAID_PREMIUM_DATE': 'Date of first unpaid premium',
+    'NO_OF_PREMIUM_PAID': 'Number of premiums paid',
+    'PREMIUMS_PAID_COUNT': 'Count of premiums paid',
+    'POLICY_YEAR': 'Current policy year',
+    'TOTAL_PREMIUM_PAID': 'Total amount of premiums paid',
+    'GSV': 'Guaranteed Surrender Value',
+    'SSV': 'Special Surrender Value',
+    'SSV1_AMT': 'Special Surrender Value component 1',
+    'SSV2_AMT': 'Special Surrender Value component 2', 
+    'SSV3_AMT': 'Special Surrender Value component 3',
+    'PAID_UP_SA': 'Paid-up Sum Assured',
+    'PAID_UP_VALUE': 'Paid-up policy value',
+    'LOYALTY_ADDITION': 'Loyalty addition amount',
+    'BONUS': 'Bonus amount',
+    'CASH_VALUE': 'Cash value of the policy',
+    'SURRENDER_CHARGE': 'Charges applicable on surrender',
+    'MORTALITY_CHARGE': 'Mortality charges',
+    'ADMIN_CHARGE': 'Administration charges',
+    'FUND_VALUE': 'Current fund value',
+    'NAV': 'Net Asset Value',
+    'UNITS': 'Number of units allocated',
+    'UNIT_PRICE': 'Price per unit',
+    'TOP_UP_PREMIUM': 'Additional premium paid',
+    'PARTIAL_WITHDRAWAL': 'Amount withdrawn partially',
+    'LOAN_AMOUNT': 'Policy loan amount',
+    'INTEREST_RATE': 'Interest rate applicable',
+    'DISCOUNT_RATE': 'Discount rate for calculations',
+    'MORTALITY_RATE': 'Mortality rate factor',
+    'LAPSE_RATE': 'Policy lapse rate',
+    'GUARANTEED_RATE': 'Guaranteed interest rate',
+    'CURRENT_RATE': 'Current interest rate',
+    'PROJECTED_RATE': 'Projected interest rate',
+    'SV_FACTOR': 'Surrender Value Factor - additional factor (sometimes policy-specific) used to adjust GSV or non-guaranteed components.',
+    'SSV2_FACTOR': 'Special Surrender Value Factor - additional factor used to adjust SSV component based on ROP or additional benefits.',
+    'SSV3_FACTOR': 'Special Surrender Value Factor - additional factor used to adjust SSV component based on paid-up income benefits or survival benefits.'
+}
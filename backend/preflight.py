@@ -0,0 +1,210 @@
+"""Fail-fast checks run on an upload before the full /process-data pass.
+
+Every formula is checked against the uploaded header: each variable must be
+a (cleaned) column, the output of an earlier formula or a factor table.
+The formulas are then evaluated on a small sample of rows from every variant,
+so a typo is reported in milliseconds instead of as one error per row.
+"""
+import ast
+import difflib
+import time
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from formula_engine import (
+    ColumnStore, FormulaCompileError, clean_column_name, compile_formula, evaluate_formula_set,
+    expression_for_variant, formula_dependencies
+)
+from factor_tables import FACTOR_TABLES
+
+DEFAULT_SAMPLE_PER_VARIANT = 25
+
+@dataclass
+class PreflightIssue:
+    severity: str  # 'error' rejects the upload, 'warning' is only reported
+    message: str
+    formula: Optional[str] = None
+    variant: Optional[str] = None
+
+@dataclass
+class PreflightReport:
+    issues: List[PreflightIssue] = field(default_factory=list)
+    sampled_rows: int = 0
+    elapsed_ms: float = 0.0
+
+    @property
+    def errors(self) -> List[PreflightIssue]:
+        return [issue for issue in self.issues if issue.severity == 'error']
+
+    @property
+    def passed(self) -> bool:
+        return not self.errors
+
+    def error(self, message: str, formula: Optional[str] = None, variant: Optional[str] = None):
+        self.issues.append(PreflightIssue('error', message, formula, variant))
+
+    def warning(self, message: str, formula: Optional[str] = None, variant: Optional[str] = None):
+        self.issues.append(PreflightIssue('warning', message, formula, variant))
+
+    def to_dict(self) -> Dict:
+        return {
+            "passed": self.passed,
+            "error_count": len(self.errors),
+            "warning_count": len(self.issues) - len(self.errors),
+            "issues": [asdict(issue) for issue in self.issues],
+            "sampled_rows": self.sampled_rows,
+            "elapsed_ms": self.elapsed_ms
+        }
+
+def stratified_sample(row_variants: np.ndarray, per_variant: int) -> np.ndarray:
+    """Up to `per_variant` rows of every variant, spread evenly over the file"""
+    rows = []
+    for variant in pd.unique(row_variants[pd.notna(row_variants)]):
+        variant_rows = np.flatnonzero(row_variants == variant)
+        positions = np.linspace(0, len(variant_rows) - 1, num=min(per_variant, len(variant_rows)))
+        rows.append(variant_rows[np.unique(positions.round().astype(np.intp))])
+    return np.sort(np.concatenate(rows)) if rows else np.empty(0, dtype=np.intp)
+
+def _unknown_name_message(name: str, later_outputs: Dict[str, str], known: List[str]) -> str:
+    if name in later_outputs:
+        return f"'{name}' is the output of a later formula ('{later_outputs[name]}'); reorder the formulas"
+    message = f"'{name}' is not a column of the upload, an earlier formula or a factor table"
+    suggestions = difflib.get_close_matches(name, known, n=1, cutoff=0.75)
+    if suggestions:
+        message += f" (did you mean '{suggestions[0]}'?)"
+    return message
+
+def _check_references(report: PreflightReport, formulas: List[Dict], columns: List[str], variants: List[str],
+                      aliases: Dict[str, str]):
+    available = {clean_column_name(col) for col in columns} | set(aliases)
+    outputs = [clean_column_name(formula.get('term_description', '').strip()) for formula in formulas]
+    terms = [formula.get('term_description', '').strip() for formula in formulas]
+
+    for formula_idx, formula in enumerate(formulas):
+        term = terms[formula_idx]
+        later_outputs = {
+            output: terms[later] for later, output in enumerate(outputs)
+            if later > formula_idx and output not in available
+        }
+        reported = set()
+        for variant in variants:
+            expr = expression_for_variant(formula, variant)
+            if not expr:
+                report.warning(f"Formula '{term}' has no expression for {variant}", term, variant)
+                continue
+            try:
+                compiled = compile_formula(expr, outputs[formula_idx])
+            except FormulaCompileError as e:
+                if expr not in reported:
+                    report.error(f"Formula '{term}': {str(e)}", term, variant)
+                    reported.add(expr)
+                continue
+
+            for name in sorted(compiled.dependencies):
+                if (name, expr) in reported:
+                    continue
+                table = FACTOR_TABLES.get(name) if name not in available else None
+                if table is not None:
+                    # A bare table name is looked up with its key columns, which must exist as well
+                    for key in table.key_columns:
+                        if clean_column_name(key) not in available and (key, expr) not in reported:
+                            reported.add((key, expr))
+                            report.error(
+                                f"Formula '{term}' ({variant}): factor table '{table.name}' is keyed on "
+                                f"'{key}', which is not a column of the upload or an earlier formula",
+                                term, variant
+                            )
+                    continue
+                if name in available:
+                    continue
+                reported.add((name, expr))
+                known = sorted(available | {table.lower() for table in FACTOR_TABLES.names()})
+                report.error(
+                    f"Formula '{term}' ({variant}): {_unknown_name_message(name, later_outputs, known)}",
+                    term, variant
+                )
+            for node in ast.walk(compiled.tree):
+                if (isinstance(node, ast.Call) and node.func.id.lower() == 'lookup' and node.args
+                        and isinstance(node.args[0], ast.Constant) and str(node.args[0].value) not in FACTOR_TABLES
+                        and (node.args[0].value, expr) not in reported):
+                    reported.add((node.args[0].value, expr))
+                    report.error(
+                        f"Formula '{term}' ({variant}): factor table '{node.args[0].value}' is not loaded",
+                        term, variant
+                    )
+        available.add(outputs[formula_idx])
+
+def _check_sample(report: PreflightReport, df: pd.DataFrame, formulas: List[Dict], row_variants: np.ndarray,
+                  variants: List[str], per_variant: int, aliases: Dict[str, str]):
+    rows = stratified_sample(row_variants, per_variant)
+    report.sampled_rows = len(rows)
+    store = ColumnStore.from_frame(df.iloc[rows], formula_dependencies(formulas, variants), aliases)
+    sample_variants = row_variants[rows]
+    outcomes = evaluate_formula_set(store, formulas, sample_variants)
+
+    for outcome in outcomes:
+        for variant in variants:
+            in_variant = outcome.attempted & (sample_variants == variant)
+            failed = in_variant & ~outcome.ok
+            n_sampled, n_failed = int(in_variant.sum()), int(failed.sum())
+            if not n_failed:
+                continue
+            expr = expression_for_variant(formulas[outcome.index], variant)
+            # Failures on rows with blank inputs are data gaps, not a broken formula
+            inputs_present = np.ones(len(rows), dtype=bool)
+            inputs = set(compile_formula(expr).dependencies)
+            # Factor columns are filled during evaluation, so the inputs are their key columns
+            for dep in inputs & store.lookup_columns:
+                inputs |= {clean_column_name(key) for key in FACTOR_TABLES.get(dep).key_columns}
+            for dep in inputs - store.lookup_columns:
+                if dep in store:
+                    inputs_present &= store.valid[dep]
+            broken = failed & inputs_present
+            first_row = int(rows[np.flatnonzero(broken if broken.any() else failed)[0]]) + 2
+
+            if n_failed == n_sampled and broken.any():
+                report.error(
+                    f"Formula '{outcome.term}' ({variant}) failed on all {n_sampled} sampled rows, "
+                    f"e.g. row {first_row}, with expression '{expr}'",
+                    outcome.term, variant
+                )
+            else:
+                report.warning(
+                    f"Formula '{outcome.term}' ({variant}) failed on {n_failed} of {n_sampled} sampled rows, "
+                    f"e.g. row {first_row}" + ("" if broken.any() else " (inputs missing)"),
+                    outcome.term, variant
+                )
+
+def run_preflight(df: pd.DataFrame, formulas: List[Dict], row_variants: np.ndarray,
+                  sample_per_variant: int = DEFAULT_SAMPLE_PER_VARIANT,
+                  aliases: Optional[Dict[str, str]] = None) -> PreflightReport:
+    """Validate formulas against the upload and a per-variant sample of its rows.
+
+    `aliases` maps variables to the upload column that holds them under another name.
+    """
+    started = time.perf_counter()
+    report = PreflightReport()
+    aliases = aliases or {}
+
+    cleaned = [clean_column_name(col) for col in df.columns]
+    duplicates = sorted({key for key in cleaned if cleaned.count(key) > 1})
+    for key in duplicates:
+        report.warning(f"Several columns clean to '{key}'; formulas will read the last one")
+    if 'COVER_CODE' not in df.columns:
+        report.error("The upload has no COVER_CODE column, so no row can be matched to a variant")
+
+    variants = sorted(pd.unique(row_variants[pd.notna(row_variants)]))
+    if 'COVER_CODE' in df.columns and not variants:
+        report.error("No COVER_CODE in the upload matches a known variant")
+
+    _check_references(report, formulas, list(df.columns), variants, aliases)
+
+    # Only sample when the formulas reference nothing unknown; otherwise every row fails anyway
+    if report.passed and variants and formulas:
+        _check_sample(report, df, formulas, row_variants, variants, sample_per_variant, aliases)
+
+    report.elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    return report
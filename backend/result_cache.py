@@ -0,0 +1,275 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from formula_engine import ColumnStore, CompiledFormula, evaluate_compiled, normalize_expression
+
+_HASH_MULTIPLIER = np.uint64(1000003)
+
+def formula_fingerprint(formula: Dict, upstream: List[str]) -> str:
+    """Fingerprint a formula from its compiled expressions and its upstream formulas"""
+    parts = [
+        formula.get('term_description', '').strip(),
+        normalize_expression(formula.get('mathematical_relationship', ''))
+    ]
+    variants = formula.get('variants') or {}
+    parts += [f"{name}={normalize_expression(expr)}" for name, expr in sorted(variants.items())]
+    parts += sorted(upstream)
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+@dataclass
+class ReusedResults:
+    """Previous-run results aligned with the current rows"""
+    hit: np.ndarray
+    values: np.ndarray
+    ok: np.ndarray
+
+@dataclass
+class _ProducedColumn:
+    fingerprint: str
+    inputs: Set[str]
+
+@dataclass
+class IncrementalStats:
+    rows_reused: int = 0
+    rows_recomputed: int = 0
+    formulas_changed: List[str] = field(default_factory=list)
+
+    def to_dict(self):
+        return {
+            "rows_reused": self.rows_reused,
+            "rows_recomputed": self.rows_recomputed,
+            "formulas_changed": self.formulas_changed
+        }
+
+class IncrementalCache:
+    """Results of the previous /process-data run.
+
+    Entries are keyed by formula fingerprint, then by a per-row fingerprint of
+    the input values that formula reads (directly or through upstream
+    formulas). Row fingerprints are kept sorted so lookups are a single
+    vectorized searchsorted.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def start_run(self, store: ColumnStore, row_variants: np.ndarray) -> 'IncrementalRun':
+        with self._lock:
+            previous = dict(self._entries)
+        return IncrementalRun(self, previous, store, row_variants)
+
+    def replace(self, entries: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]):
+        with self._lock:
+            self._entries = entries
+
+    def __len__(self):
+        return len(self._entries)
+
+class IncrementalRun:
+    """Tracks one run: serves previous results and records the new ones"""
+
+    def __init__(self, cache: IncrementalCache, previous: Dict, store: ColumnStore, row_variants: np.ndarray):
+        self.cache = cache
+        self.previous = previous
+        self.entries = {}
+        self.stats = IncrementalStats()
+        # Hash the input columns before any formula writes back into the store
+        self.variant_hash = pd.util.hash_array(np.asarray(row_variants, dtype=object).astype(str))
+        self.column_hashes = {key: pd.util.hash_array(values) for key, values in store.values.items()}
+        self.produced: Dict[str, _ProducedColumn] = {}
+        # Formulas started but not finished yet, by position in the formula set
+        # (two formulas may share an output column)
+        self._pending: Dict[int, Tuple[str, np.ndarray, np.ndarray]] = {}
+
+    def _row_keys(self, inputs: Set[str]) -> np.ndarray:
+        keys = self.variant_hash.copy()
+        for key in sorted(inputs):
+            keys *= _HASH_MULTIPLIER
+            keys ^= self.column_hashes[key]
+        return keys
+
+    def start_formula(self, index: int, formula: Dict, column: str, dependencies: Set[str], salt: List[str] = ()) -> ReusedResults:
+        inputs = {dep for dep in dependencies if dep in self.column_hashes}
+        upstream = []
+        for dep in dependencies:
+            if dep in self.produced:
+                upstream.append(self.produced[dep].fingerprint)
+                inputs |= self.produced[dep].inputs
+
+        # Which columns were read, and which were absent, is part of the formula's identity:
+        # the row keys hash values only, so another column set could otherwise reuse old rows
+        missing = {dep for dep in dependencies if dep not in self.column_hashes and dep not in self.produced}
+        columns = [f"input:{name}" for name in inputs] + [f"missing:{name}" for name in missing]
+        fingerprint = formula_fingerprint(formula, upstream + columns + list(salt))
+        row_keys = self._row_keys(inputs)
+
+        n_rows = len(row_keys)
+        reuse = ReusedResults(
+            hit=np.zeros(n_rows, dtype=bool),
+            values=np.zeros(n_rows, dtype=np.float64),
+            ok=np.zeros(n_rows, dtype=bool)
+        )
+        previous = self.previous.get(fingerprint)
+        if previous is None:
+            if self.previous:
+                self.stats.formulas_changed.append(formula.get('term_description', '').strip())
+        elif len(previous[0]):
+            known_keys, known_values, known_ok = previous
+            positions = np.searchsorted(known_keys, row_keys)
+            positions[positions >= len(known_keys)] = 0
+            reuse = ReusedResults(
+                hit=known_keys[positions] == row_keys,
+                values=known_values[positions],
+                ok=known_ok[positions]
+            )
+
+        # Later formulas reading this column depend on it even before it is finished
+        self.produced[column] = _ProducedColumn(fingerprint=fingerprint, inputs=inputs)
+        self._pending[index] = (fingerprint, row_keys, reuse.hit)
+        return reuse
+
+    def finish_formula(self, index: int, values: np.ndarray, ok: np.ndarray, attempted: np.ndarray):
+        fingerprint, row_keys, hit = self._pending.pop(index)
+
+        keys, first = np.unique(row_keys[attempted], return_index=True)
+        self.entries[fingerprint] = (keys, values[attempted][first], ok[attempted][first])
+
+        reused = int((hit & attempted).sum())
+        self.stats.rows_reused += reused
+        self.stats.rows_recomputed += int(attempted.sum()) - reused
+
+    def commit(self):
+        """Make this run's results the baseline for the next incremental run"""
+        self.cache.replace(self.entries)
+
+@dataclass
+class MemoStats:
+    lookups: int = 0
+    hits: int = 0
+    evaluations: int = 0
+
+    def to_dict(self):
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "evaluations": self.evaluations,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0
+        }
+
+class FormulaMemo:
+    """Bounded LRU of formula results keyed on the values of the variables read.
+
+    A key is the normalized expression plus the tuple of its dependency
+    values, so policies sharing the same inputs share one evaluation, within
+    a run and across runs.
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple, Tuple[float, bool]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start_run(self) -> 'MemoRun':
+        return MemoRun(self)
+
+    def get_many(self, keys: List[Tuple]) -> List[Optional[Tuple[float, bool]]]:
+        found = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                found.append(entry)
+        return found
+
+    def put_many(self, items: List[Tuple[Tuple, Tuple[float, bool]]]):
+        with self._lock:
+            for key, entry in items:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+class MemoRun:
+    """Evaluates formulas once per unique dependency tuple and records hit rates"""
+
+    def __init__(self, memo: FormulaMemo):
+        self.memo = memo
+        self.stats: Dict[str, MemoStats] = {}
+
+    def evaluate(self, compiled: CompiledFormula, store: ColumnStore, rows: np.ndarray, term: str, salt: Tuple = ()):
+        stats = self.stats.setdefault(term, MemoStats())
+        stats.lookups += len(rows)
+
+        dependencies = sorted(dep for dep in compiled.dependencies if dep in store)
+        # LOOKUP() keys treat a blank cell as a miss, so their validity is part of the tuple
+        masked = sorted(dep for dep in compiled.lookup_keys if dep in store)
+        if dependencies:
+            matrix = np.column_stack([store.values[dep][rows] for dep in dependencies] +
+                                     [store.valid[dep][rows] for dep in masked])
+            unique, inverse = np.unique(matrix, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            unique = np.empty((1, 0), dtype=np.float64)
+            inverse = np.zeros(len(rows), dtype=np.intp)
+
+        unique_values = np.zeros(len(unique), dtype=np.float64)
+        unique_ok = np.zeros(len(unique), dtype=bool)
+        expression = normalize_expression(compiled.expression)
+
+        # Too many distinct tuples to be worth caching: evaluate them once each
+        if len(unique) > self.memo.max_entries:
+            pending = np.arange(len(unique))
+            keys = None
+        else:
+            # Every dependency is named in the key and an absent one is None, so "X + 2*Y" read
+            # from an upload with only Y never answers for an upload with only X
+            column_of = {dep: column for column, dep in enumerate(dependencies)}
+            column_of.update({f"{dep}?valid": len(dependencies) + column for column, dep in enumerate(masked)})
+            names = sorted(compiled.dependencies) + [f"{dep}?valid" for dep in masked]
+            keys = [
+                (expression, salt, tuple((name, values[column_of[name]] if name in column_of else None)
+                                         for name in names))
+                for values in unique.tolist()
+            ]
+            found = self.memo.get_many(keys)
+            pending = []
+            for position, entry in enumerate(found):
+                if entry is None:
+                    pending.append(position)
+                else:
+                    unique_values[position], unique_ok[position] = entry
+            pending = np.asarray(pending, dtype=np.intp)
+
+        if len(pending):
+            tuples = ColumnStore(len(pending))
+            for column, dep in enumerate(dependencies):
+                tuples.values[dep] = np.ascontiguousarray(unique[pending, column])
+                tuples.valid[dep] = np.ones(len(pending), dtype=bool)
+            for column, dep in enumerate(masked):
+                tuples.valid[dep] = unique[pending, len(dependencies) + column] != 0
+            values, ok = evaluate_compiled(compiled, tuples)
+            unique_values[pending] = values
+            unique_ok[pending] = ok
+            if keys is not None:
+                self.memo.put_many([
+                    (keys[position], (float(value), bool(success)))
+                    for position, value, success in zip(pending.tolist(), values.tolist(), ok.tolist())
+                ])
+
+        stats.evaluations += len(pending)
+        stats.hits += len(rows) - len(pending)
+        return unique_values[inverse], unique_ok[inverse]
+
+    def to_dict(self):
+        return {term: stats.to_dict() for term, stats in self.stats.items()}
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+class RunProgress:
+    """Live progress of one /process-data run, shared with the progress endpoints.
+
+    The evaluation loop reports finished chunks through `advance` and checks
+    `cancelled` between chunks; readers only ever see `snapshot`. A cancel is
+    refused once the output file is being written.
+    """
+
+    def __init__(self, run_id: str, rows_total: int = 0, interval: float = 1.0):
+        self.run_id = run_id
+        self.rows_total = rows_total
+        self.rows_done = 0
+        self.interval = interval
+        self.status = 'queued'
+        self.message = ''
+        self.failures: Dict[str, int] = {}
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, rows_total: int):
+        with self._lock:
+            self.rows_total = rows_total
+            self.rows_done = 0
+            self.started_at = time.time()
+            self.status = 'evaluating'
+
+    def advance(self, rows: int, failures: Dict[str, int]):
+        with self._lock:
+            self.rows_done += rows
+            for term, count in failures.items():
+                self.failures[term] = self.failures.get(term, 0) + count
+
+    def set_status(self, status: str, message: str = ''):
+        with self._lock:
+            self.status = status
+            self.message = message
+            if status in ('completed', 'cancelled', 'failed'):
+                self.finished_at = time.time()
+
+    def start_writing(self) -> bool:
+        """Move to 'writing' unless a cancel came first; once writing, the run can no longer be cancelled"""
+        with self._lock:
+            if self._cancel.is_set():
+                return False
+            self.status = 'writing'
+            return True
+
+    def cancel(self) -> bool:
+        with self._lock:
+            if self.status == 'writing':
+                return False
+            self._cancel.set()
+            return True
+
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            rate = self.rows_done / elapsed if elapsed > 0 else 0.0
+            remaining = max(self.rows_total - self.rows_done, 0)
+            eta = None
+            if not self.finished and rate > 0:
+                eta = round(remaining / rate, 1)
+            return {
+                "run_id": self.run_id,
+                "status": self.status,
+                "message": self.message,
+                "rows_total": self.rows_total,
+                "rows_done": self.rows_done,
+                "percent": round(100.0 * self.rows_done / self.rows_total, 1) if self.rows_total else 0.0,
+                "rows_per_second": round(rate, 1),
+                "elapsed_seconds": round(elapsed, 1),
+                "eta_seconds": eta,
+                "failures": dict(self.failures),
+                "cancel_requested": self.cancelled()
+            }
+
+class ProgressRegistry:
+    """Runs in flight plus the most recent finished ones"""
+
+    def __init__(self, keep_finished: int = 100):
+        self.keep_finished = keep_finished
+        self._runs: 'OrderedDict[str, RunProgress]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, run_id: str, interval: float = 1.0) -> RunProgress:
+        progress = RunProgress(run_id, interval=interval)
+        with self._lock:
+            self._runs[run_id] = progress
+            self._runs.move_to_end(run_id)
+            finished = [key for key, run in self._runs.items() if run.finished]
+            for key in finished[:max(len(finished) - self.keep_finished, 0)]:
+                del self._runs[key]
+        return progress
+
+    def get(self, run_id: str) -> Optional[RunProgress]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def __contains__(self, run_id: str) -> bool:
+        with self._lock:
+            return run_id in self._runs
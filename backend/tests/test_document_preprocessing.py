@@ -0,0 +1,15 @@
+import pytest
+
+from document_preprocessing import preprocess_document_text
+
+@pytest.mark.parametrize("text, expected, joined", [
+    ("The insur-\nance premium", "The insurance premium", 1),
+    ("guaran\u00ad\nteed value", "guaranteed value", 1),
+    ("Benefits are non-\nguaranteed.", "Benefits are non-\nguaranteed.", 0),
+    ("Premium = Sum-\nassured * rate", "Premium = Sum-\nassured * rate", 0),
+    ("Sum-\nassured * rate = premium", "Sum-\nassured * rate = premium", 0),
+])
+def test_hyphenation(text, expected, joined):
+    cleaned, stats = preprocess_document_text(text)
+    assert cleaned == expected
+    assert stats.hyphenations_joined == joined
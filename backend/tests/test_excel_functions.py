@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from excel_functions import datedif, edate, excel_round, rounddown, roundup, yearfrac
+
+# Excel serials: 2012-01-01, 2012-07-30
+START, END = 40909.0, 41120.0
+
+@pytest.mark.parametrize("basis, expected", [
+    (0, 0.5805555556),
+    (1, 0.5765027322),
+    (2, 211 / 360),
+    (3, 211 / 365),
+    (4, 0.5805555556),
+])
+def test_yearfrac_bases(basis, expected):
+    assert yearfrac(np.array([START]), np.array([END]), basis)[0] == pytest.approx(expected)
+
+def test_yearfrac_ignores_order_and_blanks_invalid_dates():
+    result = yearfrac(np.array([END, np.nan]), np.array([START, END]), 3)
+    assert result[0] == pytest.approx(211 / 365)
+    assert np.isnan(result[1])
+
+def test_edate_clamps_to_month_end():
+    # 2011-01-31 -> 2011-02-28, 2010-12-31, 2012-02-29
+    result = edate(np.array([40574.0, 40574.0, 40574.0]), np.array([1, -1, 13]))
+    np.testing.assert_array_equal(result, [40602.0, 40543.0, 40968.0])
+
+@pytest.mark.parametrize("unit, expected", [
+    ("Y", 1), ("M", 14), ("D", 440), ("YM", 2), ("YD", 75), ("MD", 14),
+])
+def test_datedif_units(unit, expected):
+    # 2001-06-01 to 2002-08-15
+    assert datedif(np.array([37043.0]), np.array([37483.0]), unit)[0] == expected
+
+def test_datedif_end_before_start_is_invalid():
+    assert np.isnan(datedif(np.array([37483.0]), np.array([37043.0]), "D")[0])
+
+def test_round_half_away_from_zero():
+    values = np.array([2.5, -2.5, 0.5, -0.5, 1.005, 1234.5678])
+    np.testing.assert_array_equal(excel_round(values[:4]), [3.0, -3.0, 1.0, -1.0])
+    assert excel_round(values[4], 2) == 1.01
+    assert excel_round(values[5], -2) == 1200.0
+
+def test_roundup_and_rounddown_go_away_from_and_towards_zero():
+    values = np.array([1.21, -1.21])
+    np.testing.assert_array_equal(roundup(values, 1), [1.3, -1.3])
+    np.testing.assert_array_equal(rounddown(values, 1), [1.2, -1.2])
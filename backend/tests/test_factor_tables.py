@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from factor_tables import FactorTable
+
+def table(method, keys=(0.0, 10.0, 20.0), values=(0.0, 100.0, 400.0)):
+    frame = pd.DataFrame({'AGE': list(keys), 'FACTOR': list(values)})
+    return FactorTable.from_frame('T', frame, ['AGE'], value_column='FACTOR', method=method)
+
+def test_exact_lookup_misses_are_nan():
+    result = table('exact').lookup(np.array([10.0, 15.0, np.nan]))
+    np.testing.assert_array_equal(result, [100.0, np.nan, np.nan])
+
+def test_step_lookup_uses_the_band_below():
+    result = table('step').lookup(np.array([0.0, 15.0, 25.0, -1.0, np.nan]))
+    np.testing.assert_array_equal(result, [0.0, 100.0, 400.0, np.nan, np.nan])
+
+def test_interpolation_is_linear_between_keys_and_nan_outside():
+    result = table('interpolate').lookup(np.array([2.5, 15.0, 20.0, 21.0, np.nan]))
+    np.testing.assert_allclose(result, [25.0, 250.0, 400.0, np.nan, np.nan])
+
+def test_interpolation_is_bilinear_on_a_grid():
+    frame = pd.DataFrame({'AGE': [0, 0, 10, 10], 'TERM': [0, 10, 0, 10], 'FACTOR': [0.0, 10.0, 20.0, 40.0]})
+    grid = FactorTable.from_frame('G', frame, ['AGE', 'TERM'], value_column='FACTOR', method='interpolate')
+    assert grid.lookup(np.array([5.0]), np.array([5.0]))[0] == pytest.approx(17.5)
+    # On an edge the corner beyond it has no weight, even when that cell is empty
+    assert grid.lookup(np.array([10.0]), np.array([10.0]))[0] == pytest.approx(40.0)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import formula_engine
+from formula_backends import ne, select_backend
+from formula_engine import ColumnStore, compile_formula, evaluate_compiled
+
+pytestmark = pytest.mark.skipif(ne is None, reason="numexpr is not installed")
+
+# Comparisons and logical functions inside arithmetic, which the two backends used to disagree on
+EXPRESSIONS = [
+    "(a > 0) + (b > 0)",
+    "(a >= 1) * 10 - (b != 0)",
+    "AND(a, b) + OR(a, b) + NOT(b)",
+    "IF((a > 0) + (b > 0) = 2, 100, 0)",
+    "IF(AND(a > 0, b > 0), a, b) + (a < b)",
+    "MAX(a, b) * (a = b)",
+    "-(a > b) + MOD(a, 3)",
+]
+
+@pytest.fixture
+def store():
+    frame = pd.DataFrame({'a': [1.0, 1.0, 0.0, -2.0, 2.0], 'b': [1.0, 0.0, 0.0, 3.0, 2.0]})
+    return ColumnStore.from_frame(frame, {'a', 'b'})
+
+def evaluate(expr, store, backend, monkeypatch):
+    monkeypatch.setattr(formula_engine, 'FORMULA_BACKEND', select_backend(backend))
+    return evaluate_compiled(compile_formula(expr), store)
+
+@pytest.mark.parametrize('expr', EXPRESSIONS)
+def test_numexpr_matches_numpy(expr, store, monkeypatch):
+    numpy_values, numpy_ok = evaluate(expr, store, 'numpy', monkeypatch)
+    numexpr_values, numexpr_ok = evaluate(expr, store, 'numexpr', monkeypatch)
+    assert compile_formula(expr).kernels['numexpr'] is not None
+    np.testing.assert_array_equal(numexpr_values, numpy_values)
+    np.testing.assert_array_equal(numexpr_ok, numpy_ok)
+
+def test_comparisons_add_as_numbers(store, monkeypatch):
+    values, _ = evaluate("(a > 0) + (b > 0)", store, 'numpy', monkeypatch)
+    np.testing.assert_array_equal(values, [2.0, 1.0, 0.0, 1.0, 2.0])
+
+def test_numpy_fallback_under_numexpr_counts_comparisons(store, monkeypatch):
+    # ROUND cannot be lowered, so this runs on NumPy even with the numexpr backend
+    values, _ = evaluate("ROUND(IF((a > 0) + (b > 0) = 2, 100, 0), 0)", store, 'numexpr', monkeypatch)
+    assert compile_formula("ROUND(IF((a > 0) + (b > 0) = 2, 100, 0), 0)").kernels['numexpr'] is None
+    np.testing.assert_array_equal(values, [100.0, 0.0, 0.0, 0.0, 100.0])
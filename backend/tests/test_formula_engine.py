@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import factor_tables
+from factor_tables import FactorTable
+from formula_engine import ColumnStore, compile_formula, evaluate_compiled
+from result_cache import FormulaMemo
+
+@pytest.fixture
+def store(monkeypatch):
+    # Band 0 has a factor, so a blank key read as 0 would wrongly hit it
+    frame = pd.DataFrame({'POLICY_YEAR': [0, 1, 2], 'FACTOR': [5.0, 1.0, 2.0]})
+    table = FactorTable.from_frame('PY', frame, ['POLICY_YEAR'], value_column='FACTOR', method='step')
+    monkeypatch.setitem(factor_tables.FACTOR_TABLES._tables, 'PY', table)
+    data = pd.DataFrame({'POLICY_YEAR': [1, None, 2], 'PREMIUM': [10.0, 10.0, 10.0]})
+    return ColumnStore.from_frame(data, {'policy_year', 'premium'})
+
+@pytest.mark.parametrize("expr, expected", [
+    ('LOOKUP("PY", POLICY_YEAR) * PREMIUM', [10.0, 20.0]),
+    # Outside the key a blank is still 0
+    ('LOOKUP("PY", POLICY_YEAR + 0) + POLICY_YEAR', [2.0, 4.0]),
+])
+def test_lookup_blank_key_is_a_miss(store, expr, expected):
+    compiled = compile_formula(expr)
+    for values, ok in [evaluate_compiled(compiled, store),
+                       FormulaMemo().start_run().evaluate(compiled, store, np.arange(3), 'T')]:
+        np.testing.assert_array_equal(values[[0, 2]], expected)
+        assert np.isnan(values[1])
+        assert list(ok) == [True, False, True]
+
+def test_comparisons_add_as_numbers():
+    store = ColumnStore.from_frame(pd.DataFrame({'A': [1.0, 0.0], 'B': [1.0, 1.0]}), {'a', 'b'})
+    values, _ = evaluate_compiled(compile_formula('(A > 0) + (B > 0) + NOT(A)'), store)
+    np.testing.assert_array_equal(values, [2.0, 2.0])
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from formula_engine import ColumnStore, compile_formula, evaluate_formula_set
+from result_cache import FormulaMemo, IncrementalCache
+
+def store_for(frame):
+    return ColumnStore.from_frame(frame, {col.lower() for col in frame.columns})
+
+def run_incremental(cache, formulas, frame):
+    store = store_for(frame)
+    row_variants = np.array(['L190A01'] * len(frame), dtype=object)
+    tracker = cache.start_run(store, row_variants)
+    outcomes = evaluate_formula_set(store, formulas, row_variants, tracker=tracker)
+    tracker.commit()
+    return outcomes, tracker.stats
+
+def test_incremental_reuses_unchanged_rows():
+    cache = IncrementalCache()
+    formulas = [{"term_description": "T", "mathematical_relationship": "A * 2"}]
+    run_incremental(cache, formulas, pd.DataFrame({'A': [1.0, 2.0]}))
+    outcomes, stats = run_incremental(cache, formulas, pd.DataFrame({'A': [1.0, 3.0]}))
+    np.testing.assert_array_equal(outcomes[0].values, [2.0, 6.0])
+    assert (stats.rows_reused, stats.rows_recomputed) == (1, 1)
+
+def test_incremental_keeps_formulas_sharing_an_output_apart():
+    cache = IncrementalCache()
+    formulas = [
+        {"term_description": "T", "mathematical_relationship": "A + 1"},
+        {"term_description": "T", "mathematical_relationship": "T * 10"},
+    ]
+    frame = pd.DataFrame({'A': [1.0]})
+    run_incremental(cache, formulas, frame)
+    outcomes, stats = run_incremental(cache, formulas, frame)
+    assert [outcome.values[0] for outcome in outcomes] == [2.0, 20.0]
+    assert stats.rows_recomputed == 0
+
+def test_incremental_does_not_reuse_rows_read_from_other_columns():
+    cache = IncrementalCache()
+    formulas = [{"term_description": "T", "mathematical_relationship": "X + 2*Y"}]
+    run_incremental(cache, formulas, pd.DataFrame({'Y': [1.0]}))
+    outcomes, stats = run_incremental(cache, formulas, pd.DataFrame({'X': [1.0]}))
+    assert outcomes[0].values[0] == 1.0
+    assert stats.rows_reused == 0
+
+def test_memo_evaluates_each_input_tuple_once():
+    run = FormulaMemo().start_run()
+    store = store_for(pd.DataFrame({'A': [1.0, 2.0, 1.0, 1.0]}))
+    values, ok = run.evaluate(compile_formula('A * 2'), store, np.arange(4), 'T')
+    np.testing.assert_array_equal(values, [2.0, 4.0, 2.0, 2.0])
+    assert ok.all()
+    assert run.to_dict()['T']['evaluations'] == 2
+
+def test_memo_keys_name_every_dependency():
+    memo = FormulaMemo()
+    compiled = compile_formula('X + 2*Y')
+    results = []
+    for frame in [pd.DataFrame({'Y': [1.0]}), pd.DataFrame({'X': [1.0]})]:
+        values, _ = memo.start_run().evaluate(compiled, store_for(frame), np.arange(1), 'T')
+        results.append(values[0])
+    assert results == [2.0, 1.0]
@@ -0,0 +1,15 @@
+from run_progress import RunProgress
+
+def test_cancel_is_refused_once_writing():
+    progress = RunProgress('run')
+    progress.start(10)
+    assert progress.start_writing()
+    assert not progress.cancel()
+    assert not progress.cancelled()
+
+def test_cancel_before_writing_stops_the_write():
+    progress = RunProgress('run')
+    progress.start(10)
+    assert progress.cancel()
+    assert not progress.start_writing()
+    assert progress.status == 'evaluating'
@@ -25,9 +25,18 @@ export interface BackendResponse {
   variants_detected?: string[];
   input_variables?: { [key: string]: string };
   output_variables?: string[];
+  factor_tables?: FactorTableData[];
   api_key_configured?: boolean;
 }
 
+export interface FactorTableData {
+  name: string;
+  key_columns: string[];
+  axes: number[][];
+  grid: unknown[];
+  method: string;
+}
+
 export interface GenericTermsResponse {
   generic_terms: { [key: string]: string };
   count: number;
@@ -38,6 +47,7 @@ export interface SaveFormulaData {
   input_variables: { [key: string]: string };
   output_variables: string[];
   variants_detected: string[];
+  factor_tables?: FactorTableData[];
 }
 
 export interface SupportedFormatsResponse {
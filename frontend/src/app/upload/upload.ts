@@ -7,7 +7,7 @@ import { HttpClientModule } from '@angular/common/http';
 import { UploadService } from './upload.service';
 import { VariableService } from './variable.service';
 import { ExportService } from './export.service';
-import { ExtractedFormula, BackendResponse } from '../shared/interfaces';
+import { ExtractedFormula, BackendResponse, FactorTableData } from '../shared/interfaces';
 
 @Component({
   selector: 'app-upload',
@@ -33,6 +33,7 @@ export default class UploadComponent {
   extractionMethod = '';
   totalFormulas = 0;
   variantsDetected: string[] = [];
+  factorTables: FactorTableData[] = [];
   
   // API configuration
   apiKeyConfigured = false;
@@ -274,6 +275,7 @@ export default class UploadComponent {
     this.extractionMethod = response.extraction_method || '';
     this.totalFormulas = response.total_formulas || 0;
     this.variantsDetected = response.variants_detected || [];
+    this.factorTables = response.factor_tables || [];
 
     switch (response.status) {
       case 'success':
@@ -368,7 +370,8 @@ export default class UploadComponent {
         formulas: this.formulas,
         input_variables: this.inputVariables,
         output_variables: this.outputVariables,
-        variants_detected: this.variantsDetected
+        variants_detected: this.variantsDetected,
+        factor_tables: this.factorTables
       });
       this.uploadStatus = 'Formulas forwarded to data processing service!';
     } catch (error) {